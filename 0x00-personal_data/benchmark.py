@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the personal data redaction and hashing paths.
+
+Usage: ./benchmark.py [--lines N] [--rounds 4,8,10,12] [--only NAME]
+                      [--json FILE] [--compare FILE]
+
+Every case reports its throughput and p50/p99 latency. `--json` writes
+the results keyed by case name so runs can be compared with `--compare`.
+"""
+import argparse
+import json
+import logging
+import platform
+import re
+import sys
+import time
+
+from typing import Callable, Dict, List
+
+from encrypt_password import hash_password, is_valid
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+EXTRA_FIELDS = ('ip', 'last_login', 'user_agent', 'address', 'city',
+                'zip', 'country', 'birthday', 'company', 'title',
+                'department', 'manager', 'badge', 'locale', 'timezone')
+
+
+def legacy_filter_datum(fields: List[str], redaction: str, message: str,
+                        separator: str) -> str:
+    """
+    Reference implementation: one `re.sub` per field.
+    """
+    for field in fields:
+        message = re.sub(fr'{field}=(.*?);', f'{field}={redaction};', message)
+    return message
+
+
+def sample_lines(count: int, fields: List[str] = PII_FIELDS,
+                 pii_share: float = 1.0, value_length: int = 12) -> List[str]:
+    """
+    Build `count` log lines shaped like a row of the users table.
+
+    Args:
+        count (int): Number of lines.
+        fields (List[str]): Sensitive fields carried by PII-bearing lines.
+        pii_share (float): Share of lines carrying the sensitive fields.
+        value_length (int): Length of every field value.
+
+    Returns:
+        List[str]: The log lines.
+    """
+    every = int(round(1 / pii_share)) if pii_share else 0
+    lines = []
+    for i in range(count):
+        value = "{:0{}d}".format(i, value_length)[-value_length:]
+        keys = list(EXTRA_FIELDS[:3])
+        if every and i % every == 0:
+            keys = list(fields) + keys
+        lines.append("".join("{}={};".format(key, value) for key in keys))
+    return lines
+
+
+def measure(func: Callable, items: List, unit: str) -> Dict:
+    """
+    Time `func` on every item.
+
+    Args:
+        func (Callable): Called once per item.
+        items (List): The inputs.
+        unit (str): Name of the throughput unit.
+
+    Returns:
+        Dict: Throughput and p50/p99 latency in microseconds.
+    """
+    clock = time.perf_counter_ns
+    timings = []
+    for item in items:
+        start = clock()
+        func(item)
+        timings.append(clock() - start)
+    timings.sort()
+    total = sum(timings) or 1
+    return {
+        unit: len(items) * 1e9 / total,
+        "p50_us": timings[len(timings) // 2] / 1000,
+        "p99_us": timings[min(len(timings) - 1,
+                              len(timings) * 99 // 100)] / 1000,
+        "samples": len(items),
+    }
+
+
+def redaction_cases(count: int) -> Dict[str, Dict]:
+    """
+    Benchmark filter_datum and RedactingFormatter over field count,
+    message length and share of PII-bearing lines.
+    """
+    results = {}
+    lines = sample_lines(count)
+    for line in lines[:100]:
+        expected = legacy_filter_datum(PII_FIELDS, "***", line, ";")
+        assert filter_datum(PII_FIELDS, "***", line, ";") == expected
+
+    results["filter_datum/legacy"] = measure(
+        lambda line: legacy_filter_datum(PII_FIELDS, "***", line, ";"),
+        lines, "lines_per_sec")
+
+    for field_count in (1, 5, 10, 20):
+        fields = (PII_FIELDS + EXTRA_FIELDS[3:])[:field_count]
+        lines = sample_lines(count, fields)
+        results["filter_datum/fields={}".format(field_count)] = measure(
+            lambda line: filter_datum(fields, "***", line, ";"),
+            lines, "lines_per_sec")
+
+    for value_length in (8, 64, 512):
+        lines = sample_lines(count, value_length=value_length)
+        results["filter_datum/value_length={}".format(value_length)] = \
+            measure(lambda line: filter_datum(PII_FIELDS, "***", line, ";"),
+                    lines, "lines_per_sec")
+
+    for pii_share in (0.0, 0.1, 0.5, 1.0):
+        formatter = RedactingFormatter(PII_FIELDS)
+        records = [logging.LogRecord("user_data", logging.INFO, None, None,
+                                     line, None, None)
+                   for line in sample_lines(count, pii_share=pii_share)]
+        result = measure(formatter.format, records, "lines_per_sec")
+        result["prefilter_hits"] = formatter.prefilter_hits
+        result["prefilter_misses"] = formatter.prefilter_misses
+        results["formatter/pii_share={}".format(pii_share)] = result
+
+    return results
+
+
+def hashing_cases(rounds: List[int], count: int) -> Dict[str, Dict]:
+    """
+    Benchmark hash_password and is_valid at several bcrypt costs.
+    """
+    results = {}
+    for cost in rounds:
+        samples = max(3, count >> max(0, cost - 4))
+        passwords = ["password{}".format(i) for i in range(samples)]
+        hashes = []
+        results["hash_password/rounds={}".format(cost)] = measure(
+            lambda pwd: hashes.append(hash_password(pwd, cost)),
+            passwords, "hashes_per_sec")
+        pairs = list(zip(hashes, passwords))
+        results["is_valid/rounds={}".format(cost)] = measure(
+            lambda pair: is_valid(*pair), pairs, "hashes_per_sec")
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> None:
+    """
+    Print the throughput ratio of every case against a previous run.
+    """
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        unit = next(key for key in result if key.endswith("_per_sec"))
+        ratio = result[unit] / previous[unit]
+        flag = "  REGRESSION" if ratio < 0.9 else ""
+        print("{:<32} {:>7.2f}x{}".format(name, ratio, flag))
+
+
+def main():
+    """
+    Run the selected cases and report them.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--rounds", default="4,8,10,12")
+    parser.add_argument("--only", choices=("redaction", "hashing"))
+    parser.add_argument("--json", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE")
+    args = parser.parse_args()
+
+    results = {}
+    if args.only in (None, "redaction"):
+        results.update(redaction_cases(args.lines))
+    if args.only in (None, "hashing"):
+        rounds = [int(cost) for cost in args.rounds.split(",")]
+        results.update(hashing_cases(rounds, 64))
+
+    for name, result in results.items():
+        unit = next(key for key in result if key.endswith("_per_sec"))
+        print("{:<32} {:>12,.0f} {:<11} p50 {:>9.1f}us  p99 {:>9.1f}us"
+              .format(name, result[unit], unit.replace("_per_", "/"),
+                      result["p50_us"], result["p99_us"]))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+    if args.json:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "argv": sys.argv[1:],
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,20 +3,206 @@
 Module for encrypting passwords
 """
 import bcrypt
+import hashlib
+import hmac
+import os
+import threading
+import time
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Tuple
 
-def hash_password(password: str) -> bytes:
+BCRYPT_ROUNDS = int(os.getenv("PERSONAL_DATA_BCRYPT_ROUNDS", "12"))
+
+
+class VerificationCache:
+    """
+    Bounded, TTL-limited cache of successful password verifications.
+
+    Entries are keyed by an HMAC of (hashed password, password) under a
+    secret generated for this process, so neither the plaintext nor
+    anything reusable outside the process is stored. Failed verifications
+    are never cached.
+
+    Attributes:
+        maxsize (int): Maximum number of cached verifications.
+        ttl (float): Seconds a verification stays valid.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that needed a bcrypt check.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        """
+        Initialize VerificationCache.
+
+        Args:
+            maxsize (int): Maximum number of cached verifications.
+            ttl (float): Seconds a verification stays valid.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._secret = os.urandom(32)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_hash = {}
+
+    def _digest(self, *parts: bytes) -> bytes:
+        """
+        HMAC the length-prefixed parts under the process secret.
+        """
+        mac = hmac.new(self._secret, digestmod=hashlib.sha256)
+        for part in parts:
+            mac.update(len(part).to_bytes(4, "big"))
+            mac.update(part)
+        return mac.digest()
+
+    def check(self, hashed_password: bytes, password: str) -> bool:
+        """
+        Tell whether this pair was verified within the TTL.
+
+        Args:
+            hashed_password (bytes): The hashed password.
+            password (str): The password to validate.
+
+        Returns:
+            bool: True on a cache hit.
+        """
+        key = self._digest(hashed_password, password.encode())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            if entry is not None:
+                self._evict(key)
+            self.misses += 1
+            return False
+
+    def add(self, hashed_password: bytes, password: str) -> None:
+        """
+        Remember a successful verification.
+
+        Args:
+            hashed_password (bytes): The hashed password.
+            password (str): The password that matched it.
+        """
+        key = self._digest(hashed_password, password.encode())
+        owner = self._digest(hashed_password)
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (time.monotonic() + self.ttl, owner)
+            self._by_hash.setdefault(owner, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._evict(next(iter(self._entries)))
+
+    def invalidate(self, hashed_password: bytes) -> None:
+        """
+        Drop every verification of a hashed password, e.g. when the
+        password is changed.
+
+        Args:
+            hashed_password (bytes): The hashed password being replaced.
+        """
+        owner = self._digest(hashed_password)
+        with self._lock:
+            for key in list(self._by_hash.get(owner, ())):
+                self._evict(key)
+
+    def clear(self) -> None:
+        """
+        Drop every cached verification.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._by_hash.clear()
+
+    def stats(self) -> dict:
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: hits, misses, hit_rate, size, maxsize and ttl.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+    def _evict(self, key: bytes) -> None:
+        """
+        Remove one entry; the lock must be held.
+        """
+        _, owner = self._entries.pop(key)
+        keys = self._by_hash[owner]
+        keys.discard(key)
+        if not keys:
+            del self._by_hash[owner]
+
+
+_verification_cache = None
+
+
+def enable_verification_cache(maxsize: int = 1024,
+                              ttl: float = 300.0) -> VerificationCache:
+    """
+    Turns on caching of successful is_valid checks.
+
+    Args:
+        maxsize (int): Maximum number of cached verifications.
+        ttl (float): Seconds a verification stays valid.
+
+    Returns:
+        VerificationCache: The cache now used by is_valid.
+    """
+    global _verification_cache
+    _verification_cache = VerificationCache(maxsize, ttl)
+    return _verification_cache
+
+
+def disable_verification_cache() -> None:
+    """
+    Turns off caching of is_valid checks and drops the cache.
+    """
+    global _verification_cache
+    _verification_cache = None
+
+
+def invalidate_password(hashed_password: bytes) -> None:
+    """
+    Forgets cached verifications of a hashed password. Call it when a
+    user's password changes.
+
+    Args:
+        hashed_password (bytes): The hashed password being replaced.
+    """
+    if _verification_cache is not None:
+        _verification_cache.invalidate(hashed_password)
+
+
+def hash_password(password: str, rounds: int = None) -> bytes:
     """
     Hashes a password with a randomly-generated salt and
     returns the hashed password.
 
     Args:
         password (str): The password to hash.
+        rounds (int): The bcrypt cost factor (default: BCRYPT_ROUNDS).
 
     Returns:
         bytes: The hashed password.
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(BCRYPT_ROUNDS if rounds is None else rounds)
     hashed_password = bcrypt.hashpw(password.encode(), salt)
 
     return hashed_password
@@ -27,6 +213,9 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     Validates that the provided password matches the
     hashed password.
 
+    When enabled, successful checks are served from the verification
+    cache until their TTL expires.
+
     Args:
         hashed_password (bytes): The hashed password.
         password (str): The password to validate.
@@ -34,4 +223,81 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     Returns:
         bool: True if the password is valid, False otherwise.
     """
-    return bcrypt.checkpw(password.encode(), hashed_password)
+    cache = _verification_cache
+    if cache is not None and cache.check(hashed_password, password):
+        return True
+    valid = bcrypt.checkpw(password.encode(), hashed_password)
+    if valid and cache is not None:
+        cache.add(hashed_password, password)
+    return valid
+
+
+def hash_many(passwords: Iterable[str], rounds: int = None,
+              workers: int = None) -> List[bytes]:
+    """
+    Hashes several passwords in parallel.
+
+    bcrypt releases the GIL while hashing, so a thread pool scales
+    with the number of cores.
+
+    Args:
+        passwords (Iterable[str]): The passwords to hash.
+        rounds (int): The bcrypt cost factor (default: BCRYPT_ROUNDS).
+        workers (int): Number of threads (default: CPU count).
+
+    Returns:
+        List[bytes]: The hashed passwords, in input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(lambda pwd: hash_password(pwd, rounds),
+                                 passwords))
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]],
+                workers: int = None) -> List[bool]:
+    """
+    Validates several (hashed_password, password) pairs in parallel.
+
+    Args:
+        pairs (Iterable[Tuple[bytes, str]]): The pairs to validate.
+        workers (int): Number of threads (default: CPU count).
+
+    Returns:
+        List[bool]: Whether each password is valid, in input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(lambda pair: is_valid(*pair), pairs))
+
+
+def calibrate_rounds(target_ms: float = 250.0, min_rounds: int = 4,
+                     max_rounds: int = 16) -> int:
+    """
+    Returns the highest cost factor whose hash time fits the target.
+
+    Each extra round doubles the work, so a single timing at `min_rounds`
+    is scaled up and then checked against one real hash.
+
+    Args:
+        target_ms (float): Target latency of one hash in milliseconds.
+        min_rounds (int): Lowest cost factor to consider.
+        max_rounds (int): Highest cost factor to consider.
+
+    Returns:
+        int: The cost factor to use on this machine.
+    """
+    def measure(rounds: int) -> float:
+        salt = bcrypt.gensalt(rounds)
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", salt)
+        return (time.perf_counter() - start) * 1000
+
+    base = measure(min_rounds)
+    rounds = min_rounds
+    while rounds < max_rounds and base * 2 ** (rounds + 1 - min_rounds) \
+            <= target_ms:
+        rounds += 1
+    while rounds > min_rounds and measure(rounds) > target_ms:
+        rounds -= 1
+    return rounds
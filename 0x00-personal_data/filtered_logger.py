@@ -4,14 +4,54 @@ Module for filtering log messages
 """
 
 import re
+import atexit
+import io
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import sqlite3
+import sys
+import threading
 import mysql.connector
 
-from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
+from typing import (Callable, Iterator, List, Mapping, Optional, Pattern,
+                    TextIO, Tuple)
 
 PII_FIELDS = ('name', 'email', 'phone', 'ssn', 'password')
 
+_JSON_ENCODER = json.JSONEncoder(separators=(',', ':'), check_circular=False,
+                                 default=str)
+
+
+@lru_cache(maxsize=64)
+def _redaction_pattern(fields: Tuple[str, ...], separator: str) -> Pattern:
+    """
+    Return the compiled pattern matching the value of any of `fields`.
+
+    All fields are folded into a single pattern so a message is redacted
+    in one scan. The match starts at the `=` and each field name is
+    checked with a lookbehind, which lets the regex engine jump between
+    `=` signs and keeps the replacement a plain string. Patterns are
+    cached per (fields, separator).
+
+    :param fields: Tuple of field names to obfuscate
+    :param separator: Character separating fields in the log message
+    :return: Compiled regular expression
+    """
+    lookbehinds = '|'.join('(?<={}=)'.format(re.escape(field))
+                           for field in fields)
+    if len(separator) == 1:
+        value = r'[^{}\n]*'.format(re.escape(separator))
+    else:
+        value = '.*?'
+    return re.compile('=(?:{}){}{}'.format(lookbehinds, value,
+                                           re.escape(separator)))
+
 
 def filter_datum(fields: List[str], redaction: str, message: str,
                  separator: str) -> str:
@@ -24,9 +64,11 @@ def filter_datum(fields: List[str], redaction: str, message: str,
     :param separator: Character separating fields in the log message
     :return: Log message with obfuscated fields
     """
-    for field in fields:
-        message = re.sub(fr'{field}=(.*?);', f'{field}={redaction};', message)
-    return message
+    if not fields:
+        return message
+    pattern = _redaction_pattern(tuple(fields), separator)
+    replacement = '=' + redaction + separator
+    return pattern.sub(replacement.replace('\\', '\\\\'), message)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -37,23 +79,39 @@ class RedactingFormatter(logging.Formatter):
     redaction. It replaces specified fields in the log messages with a
     redaction string to prevent sensitive information from being logged.
 
+    Lines are first checked for any `<field>=` key with plain substring
+    tests; lines without one skip the redaction pass entirely.
+
+    In structured mode, records carrying a mapping (as `record.args` or
+    `extra={"data": ...}`) are redacted by key lookup and emitted as
+    compact JSON lines, without any regex scan.
+
     Attributes:
         fields (List[str]): A list of field names to obfuscate.
+        structured (bool): Emit JSON lines instead of text.
+        prefilter_hits (int): Lines that contained a sensitive key.
+        prefilter_misses (int): Lines that skipped redaction.
     """
 
     REDACTION = "***"
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str], structured: bool = False):
         """
         Initialize RedactingFormatter with the fields to obfuscate.
 
         Args:
             fields (List[str]): A list of field names to obfuscate.
+            structured (bool): Emit JSON lines instead of text.
         """
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.structured = structured
+        self._field_set = frozenset(fields)
+        self._keys = tuple(field + '=' for field in fields)
+        self.prefilter_hits = 0
+        self.prefilter_misses = 0
 
     def format(self, record: logging.LogRecord) -> str:
         """
@@ -65,47 +123,259 @@ class RedactingFormatter(logging.Formatter):
         Returns:
             str: The formatted log record with specified fields obfuscated.
         """
+        if self.structured:
+            return self.format_json(record)
         original_message = logging.Formatter.format(self, record)
+        for key in self._keys:
+            if key in original_message:
+                break
+        else:
+            self.prefilter_misses += 1
+            return original_message
+        self.prefilter_hits += 1
         return filter_datum(self.fields,
                             self.REDACTION, original_message, self.SEPARATOR)
 
+    def format_json(self, record: logging.LogRecord) -> str:
+        """
+        Format the record as a compact JSON line.
+
+        A mapping passed as `record.args` or `extra={"data": ...}` is
+        redacted by key; its message template is not interpolated.
+        Without a mapping the message is redacted as text.
+
+        Args:
+            record (logging.LogRecord): The log record to format.
+
+        Returns:
+            str: The JSON line with specified fields obfuscated.
+        """
+        data = self._record_data(record)
+        if data is None:
+            message = filter_datum(self.fields, self.REDACTION,
+                                   record.getMessage(), self.SEPARATOR)
+        else:
+            message = str(record.msg)
+            fields = self._field_set
+            data = {key: self.REDACTION if key in fields else value
+                    for key, value in data.items()}
+        entry = {
+            "name": record.name,
+            "level": record.levelname,
+            "time": self.formatTime(record, self.datefmt),
+            "message": message,
+        }
+        if data is not None:
+            entry["data"] = data
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return _JSON_ENCODER.encode(entry)
+
+    @staticmethod
+    def _record_data(record: logging.LogRecord) -> Optional[Mapping]:
+        """
+        Return the structured payload of a record, if any.
+        """
+        data = getattr(record, "data", None)
+        if isinstance(data, Mapping):
+            return data
+        if isinstance(record.args, Mapping):
+            return record.args
+        return None
+
+
+class PolicyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that hands records over to a listener thread.
+
+    Records are enqueued as-is: message merging, redaction and the stream
+    write all happen on the listener thread. When the bounded queue is
+    full the handler either blocks the caller or drops the record.
+
+    Attributes:
+        block (bool): Block on a full queue instead of dropping.
+        dropped (int): Number of records dropped on a full queue.
+    """
+
+    def __init__(self, log_queue: queue.Queue, block: bool = True):
+        """
+        Initialize PolicyQueueHandler with its queue and full-queue policy.
+
+        Args:
+            log_queue (queue.Queue): The queue shared with the listener.
+            block (bool): Block on a full queue instead of dropping.
+        """
+        super(PolicyQueueHandler, self).__init__(log_queue)
+        self.block = block
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Leave the record untouched, formatting is done by the listener.
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Put the record on the queue according to the full-queue policy.
+        """
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener:
+    """
+    Background thread writing queued records through a StreamHandler.
+
+    Every wake-up drains up to `batch_size` records from the queue and
+    writes them with a single stream write and flush.
+    """
+
+    _sentinel = None
+
+    def __init__(self, log_queue: queue.Queue,
+                 handler: logging.StreamHandler, batch_size: int = 512):
+        """
+        Initialize BatchingQueueListener.
+
+        Args:
+            log_queue (queue.Queue): The queue to drain.
+            handler (logging.StreamHandler): Formats and writes the records.
+            batch_size (int): Maximum number of records per write.
+        """
+        self.queue = log_queue
+        self.handler = handler
+        self.batch_size = max(1, batch_size)
+        self._thread = None
 
+    def start(self) -> None:
+        """
+        Start the listener thread.
+        """
+        self._thread = threading.Thread(target=self._monitor, daemon=True,
+                                        name="user_data-log-listener")
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Write everything still queued and wait for the thread to exit.
+        """
+        if self._thread is None:
+            return
+        self.queue.put(self._sentinel)
+        self._thread.join()
+        self._thread = None
+
+    def _monitor(self) -> None:
+        """
+        Drain the queue in batches until the sentinel is seen.
+        """
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not self._sentinel and \
+                    len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = batch[-1] is self._sentinel
+            if done:
+                batch.pop()
+            if batch:
+                self.write(batch)
+            if done:
+                return
+
+    def write(self, records: List[logging.LogRecord]) -> None:
+        """
+        Format the records and write them to the stream in one call.
+
+        A failed write is reported through handler.handleError for each
+        record of the batch, as StreamHandler.emit does, so the listener
+        keeps draining the queue.
+
+        Args:
+            records (List[logging.LogRecord]): The records to write.
+        """
+        handler = self.handler
+        lines = []
+        written = []
+        for record in records:
+            if record.levelno < handler.level:
+                continue
+            try:
+                lines.append(handler.format(record))
+                written.append(record)
+            except Exception:
+                handler.handleError(record)
+        if not lines:
+            return
+        handler.acquire()
+        try:
+            handler.stream.write(handler.terminator.join(lines) +
+                                 handler.terminator)
+            handler.flush()
+        except Exception:
+            for record in written:
+                handler.handleError(record)
+        finally:
+            handler.release()
+
+
+@lru_cache(maxsize=None)
 def get_logger() -> logging.Logger:
     """
     Returns a logging.Logger object.
 
     The logger is named "user_data", logs up to logging.INFO level,
     does not propagate messages to other loggers,
-    and has a StreamHandler with RedactingFormatter as formatter.
+    and hands its records to a StreamHandler with RedactingFormatter
+    as formatter running on a background listener thread.
+
+    The logger is built once and cached. The queue is configured by the
+    environment variables:
+    - PERSONAL_DATA_LOG_QUEUE_SIZE (default: 10000)
+    - PERSONAL_DATA_LOG_QUEUE_POLICY, "block" or "drop" (default: "block")
+    - PERSONAL_DATA_LOG_BATCH_SIZE (default: 512)
+    - PERSONAL_DATA_LOG_FORMAT, "text" or "json" (default: "text")
 
     Returns:
         logging.Logger: The configured logger.
     """
+    queue_size = int(os.getenv("PERSONAL_DATA_LOG_QUEUE_SIZE", "10000"))
+    policy = os.getenv("PERSONAL_DATA_LOG_QUEUE_POLICY", "block")
+    batch_size = int(os.getenv("PERSONAL_DATA_LOG_BATCH_SIZE", "512"))
+    if policy not in ("block", "drop"):
+        raise ValueError("Invalid PERSONAL_DATA_LOG_QUEUE_POLICY: {}"
+                         .format(policy))
+
     logger = logging.getLogger("user_data")
     logger.setLevel(logging.INFO)
     logger.propagate = False
 
     stream_handler = logging.StreamHandler()
-    formatter = RedactingFormatter(PII_FIELDS)
+    structured = os.getenv("PERSONAL_DATA_LOG_FORMAT", "text") == "json"
+    formatter = RedactingFormatter(PII_FIELDS, structured)
     stream_handler.setFormatter(formatter)
 
-    logger.addHandler(stream_handler)
+    log_queue = queue.Queue(queue_size)
+    logger.addHandler(PolicyQueueHandler(log_queue, policy == "block"))
+
+    listener = BatchingQueueListener(log_queue, stream_handler, batch_size)
+    listener.start()
+    atexit.register(listener.stop)
 
     return logger
 
 
-def get_db() -> mysql.connector.connection.MySQLConnection:
+def _connect_mysql() -> mysql.connector.connection.MySQLConnection:
     """
-    Returns a connector to the database.
-
-    The database credentials are obtained from the environment variables:
-    - PERSONAL_DATA_DB_USERNAME (default: "root")
-    - PERSONAL_DATA_DB_PASSWORD (default: "")
-    - PERSONAL_DATA_DB_HOST (default: "localhost")
-    - PERSONAL_DATA_DB_NAME
-
-    Returns:
-        mysql.connector.connection.MySQLConnection: The database connector.
+    Open a new MySQL connection from the PERSONAL_DATA_DB_* variables.
     """
     username = os.getenv("PERSONAL_DATA_DB_USERNAME", "root")
     password = os.getenv("PERSONAL_DATA_DB_PASSWORD", "")
@@ -122,23 +392,474 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return db
 
 
+def _connect_sqlite() -> sqlite3.Connection:
+    """
+    Open the SQLite file named by PERSONAL_DATA_DB_NAME, a local stand-in
+    for the MySQL database.
+    """
+    db_name = os.getenv("PERSONAL_DATA_DB_NAME") or ":memory:"
+    return sqlite3.connect(db_name, check_same_thread=False)
+
+
+DB_BACKENDS = {
+    "mysql": _connect_mysql,
+    "sqlite": _connect_sqlite,
+}
+
+
+class PooledConnection:
+    """
+    Connection checked out of a ConnectionPool.
+
+    Every attribute is forwarded to the underlying connection, except
+    `close` which hands the connection back to its pool.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', connection):
+        """
+        Wrap `connection`, which belongs to `pool`.
+        """
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name: str):
+        """
+        Forward attribute access to the underlying connection.
+        """
+        if self._connection is None:
+            raise AttributeError("Connection already returned to the pool")
+        return getattr(self._connection, name)
+
+    def close(self) -> None:
+        """
+        Return the connection to the pool; closing twice is a no-op.
+        """
+        if self._connection is not None:
+            self._pool.release(self._connection)
+            self._connection = None
+
+    def __enter__(self) -> 'PooledConnection':
+        """
+        Use the checked out connection as a context manager.
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """
+        Return the connection to the pool on exit.
+        """
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections.
+
+    At most `size` connections are open at once; callers block (up to
+    `timeout` seconds) when all of them are checked out. Idle connections
+    are health-checked on checkout and replaced when dead. Connections
+    inherited through fork are never reused by the child process.
+
+    Attributes:
+        connect (Callable): Factory opening a new connection.
+        size (int): Maximum number of open connections.
+        timeout (float): Seconds to wait for a free connection.
+    """
+
+    def __init__(self, connect: Callable, size: int = 5,
+                 timeout: float = 30.0):
+        """
+        Initialize ConnectionPool.
+
+        Args:
+            connect (Callable): Factory opening a new connection.
+            size (int): Maximum number of open connections.
+            timeout (float): Seconds to wait for a free connection.
+        """
+        self.connect = connect
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        """
+        Forget every connection and counter, e.g. after a fork.
+        """
+        self._pid = os.getpid()
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._stats = dict.fromkeys(("created", "checkouts", "reused",
+                                     "discarded", "in_use"), 0)
+
+    def acquire(self) -> PooledConnection:
+        """
+        Check out a healthy connection, opening one if none is idle.
+
+        Returns:
+            PooledConnection: The connection; `close()` returns it.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No database connection available")
+        try:
+            connection = None
+            while connection is None:
+                with self._lock:
+                    idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    connection = self.connect()
+                    with self._lock:
+                        self._stats["created"] += 1
+                elif self._is_alive(idle):
+                    connection = idle
+                    with self._lock:
+                        self._stats["reused"] += 1
+                else:
+                    self._discard(idle)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+        return PooledConnection(self, connection)
+
+    def release(self, connection) -> None:
+        """
+        Take a checked out connection back.
+
+        Args:
+            connection: The underlying connection being returned.
+        """
+        if self._pid != os.getpid():
+            return
+        try:
+            connection.rollback()
+        except Exception:
+            self._discard(connection)
+        else:
+            with self._lock:
+                self._idle.append(connection)
+        with self._lock:
+            self._stats["in_use"] -= 1
+        self._slots.release()
+
+    def close(self) -> None:
+        """
+        Close every idle connection.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        """
+        Return the pool counters.
+
+        Returns:
+            dict: created, checkouts, reused, discarded, in_use, idle
+            and size.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+        stats["size"] = self.size
+        return stats
+
+    def _discard(self, connection) -> None:
+        """
+        Close a dead connection and count it.
+        """
+        with self._lock:
+            self._stats["discarded"] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_alive(connection) -> bool:
+        """
+        Check that a connection still answers.
+        """
+        try:
+            if hasattr(connection, "is_connected"):
+                return connection.is_connected()
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1;")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+
+@lru_cache(maxsize=None)
+def get_db_pool() -> ConnectionPool:
+    """
+    Returns the process-wide connection pool used by get_db.
+
+    The pool is sized by PERSONAL_DATA_DB_POOL_SIZE and opens connections
+    with the backend named by PERSONAL_DATA_DB_BACKEND.
+
+    Returns:
+        ConnectionPool: The connection pool.
+    """
+    size = int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", "5")) or 5
+    backend = os.getenv("PERSONAL_DATA_DB_BACKEND", "mysql")
+    return ConnectionPool(DB_BACKENDS[backend], size)
+
+
+def get_db() -> mysql.connector.connection.MySQLConnection:
+    """
+    Returns a connector to the database.
+
+    The database credentials are obtained from the environment variables:
+    - PERSONAL_DATA_DB_USERNAME (default: "root")
+    - PERSONAL_DATA_DB_PASSWORD (default: "")
+    - PERSONAL_DATA_DB_HOST (default: "localhost")
+    - PERSONAL_DATA_DB_NAME
+    - PERSONAL_DATA_DB_BACKEND, "mysql" or "sqlite" (default: "mysql")
+    - PERSONAL_DATA_DB_POOL_SIZE (default: 0, no pooling)
+
+    When a pool size is set, the connection comes from get_db_pool() and
+    closing it returns it to the pool.
+
+    Returns:
+        mysql.connector.connection.MySQLConnection: The database connector.
+    """
+    if int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", "0")) > 0:
+        return get_db_pool().acquire()
+
+    backend = os.getenv("PERSONAL_DATA_DB_BACKEND", "mysql")
+    return DB_BACKENDS[backend]()
+
+
+def redacted_rows(cursor, batch_size: int = 1000) -> Iterator[List[str]]:
+    """
+    Yield the rows of an executed cursor as batches of formatted lines.
+
+    Rows are fetched `batch_size` at a time, so memory stays flat however
+    large the result set is. The redaction mask is computed once from the
+    cursor's columns and folded into a single format template.
+
+    Args:
+        cursor: A DB-API cursor on which a query has been executed.
+        batch_size (int): Number of rows fetched per round trip.
+
+    Yields:
+        List[str]: `field=value; ...` lines with PII fields redacted.
+    """
+    columns = [column[0] for column in cursor.description]
+    template = "; ".join(
+        "{}={}".format(column.replace("{", "{{").replace("}", "}}"),
+                       RedactingFormatter.REDACTION if column in PII_FIELDS
+                       else "{}")
+        for column in columns)
+    kept = [i for i, column in enumerate(columns) if column not in PII_FIELDS]
+
+    if not kept:
+        def render(row):
+            return template
+    elif len(kept) == 1:
+        def render(row, index=kept[0]):
+            return template.format(row[index])
+    else:
+        def render(row, values=itemgetter(*kept)):
+            return template.format(*values(row))
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield [render(row) for row in rows]
+
+
+def _write_rows(cursor, sink: TextIO, batch_size: int) -> int:
+    """
+    Write the rows of an executed cursor to `sink`, one batch per write.
+
+    Args:
+        cursor: A DB-API cursor on which a query has been executed.
+        sink (TextIO): Where to write the lines.
+        batch_size (int): Number of rows fetched and written at once.
+
+    Returns:
+        int: The number of rows written.
+    """
+    formatter = logging.Formatter(RedactingFormatter.FORMAT)
+    count = 0
+    for lines in redacted_rows(cursor, batch_size):
+        record = logging.LogRecord("user_data", logging.INFO, None, None,
+                                   "", None, None)
+        prefix = formatter.format(record)
+        sink.write("".join(prefix + line + "\n" for line in lines))
+        count += len(lines)
+    return count
+
+
+def export_users(db, sink: TextIO = None, batch_size: int = 1000) -> int:
+    """
+    Stream the users table to `sink` in batches, bypassing the logger.
+
+    Lines carry the same prefix as the "user_data" logger output; the
+    timestamp is taken once per batch and each batch is written with a
+    single call.
+
+    Args:
+        db: An open database connection.
+        sink (TextIO): Where to write the lines (default: sys.stderr).
+        batch_size (int): Number of rows fetched and written at once.
+
+    Returns:
+        int: The number of rows written.
+    """
+    sink = sys.stderr if sink is None else sink
+
+    cursor = db.cursor()
+    cursor.execute("SELECT * FROM users;")
+    count = _write_rows(cursor, sink, batch_size)
+    sink.flush()
+    cursor.close()
+
+    return count
+
+
+def _key_ranges(low: int, high: int, shards: int) -> List[Tuple[int, int]]:
+    """
+    Split the inclusive key range [low, high] into half-open ranges.
+
+    Args:
+        low (int): Smallest key.
+        high (int): Largest key.
+        shards (int): Maximum number of ranges.
+
+    Returns:
+        List[Tuple[int, int]]: Contiguous (start, stop) ranges in key order.
+    """
+    step = max(1, -(-(high - low + 1) // max(1, shards)))
+    return [(start, min(start + step, high + 1))
+            for start in range(low, high + 1, step)]
+
+
+def _export_shard(connect: Callable, key: str, start: int, stop: int,
+                  batch_size: int) -> Tuple[str, int]:
+    """
+    Render the users whose `key` lies in [start, stop), in key order.
+
+    Runs in a worker process with its own database connection.
+
+    Returns:
+        Tuple[str, int]: The rendered lines and their count.
+    """
+    db = connect()
+    cursor = db.cursor()
+    cursor.execute("SELECT * FROM users WHERE {0} >= {1} AND {0} < {2} "
+                   "ORDER BY {0};".format(key, int(start), int(stop)))
+    sink = io.StringIO()
+    count = _write_rows(cursor, sink, batch_size)
+    cursor.close()
+    db.close()
+    return sink.getvalue(), count
+
+
+def export_users_parallel(sink: TextIO = None, workers: int = None,
+                          key: str = "id", batch_size: int = 1000,
+                          connect: Callable = get_db) -> int:
+    """
+    Export the users table with a pool of worker processes.
+
+    The table is split into ranges of its integer primary key `key`.
+    Each range is rendered by a worker holding its own connection from
+    `connect`, and the results are written to `sink` in key order.
+
+    Args:
+        sink (TextIO): Where to write the lines (default: sys.stderr).
+        workers (int): Number of processes (default: CPU count).
+        key (str): Integer primary key column used to shard the table.
+        batch_size (int): Number of rows fetched at once by a worker.
+        connect (Callable): Picklable connection factory (default: get_db).
+
+    Returns:
+        int: The number of rows written.
+    """
+    if not re.fullmatch(r'\w+', key):
+        raise ValueError("Invalid key column: {}".format(key))
+    sink = sys.stderr if sink is None else sink
+    workers = workers or os.cpu_count() or 1
+
+    db = connect()
+    cursor = db.cursor()
+    cursor.execute("SELECT MIN({0}), MAX({0}) FROM users;".format(key))
+    low, high = cursor.fetchone()
+    cursor.close()
+    db.close()
+    if low is None:
+        return 0
+
+    ranges = _key_ranges(int(low), int(high), workers * 4)
+    count = 0
+    with ProcessPoolExecutor(workers) as executor:
+        shards = executor.map(_export_shard,
+                              *zip(*[(connect, key, start, stop, batch_size)
+                                     for start, stop in ranges]))
+        for text, shard_count in shards:
+            sink.write(text)
+            count += shard_count
+    sink.flush()
+
+    return count
+
+
 def main():
     """
     Connects to the database, retrieves all rows in the users table,
     and displays each row in a filtered format.
+
+    The export is configured by the environment variables:
+    - PERSONAL_DATA_EXPORT_MODE, "log", "stream" or "parallel"
+      (default: "log")
+    - PERSONAL_DATA_EXPORT_BATCH_SIZE (default: 1000)
+    - PERSONAL_DATA_EXPORT_WORKERS, for "parallel" (default: CPU count)
+    - PERSONAL_DATA_EXPORT_KEY, for "parallel" (default: "id")
+
+    With PERSONAL_DATA_LOG_FORMAT=json, the "log" mode hands each row to
+    the logger as a mapping and lets the formatter redact it by key.
     """
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM users;")
+    mode = os.getenv("PERSONAL_DATA_EXPORT_MODE", "log")
+    batch_size = int(os.getenv("PERSONAL_DATA_EXPORT_BATCH_SIZE", "1000"))
 
-    for row in cursor:
-        formatted_row = "; ".join(f"{field}={value}" if field not in PII_FIELDS
-                                  else f"{field}=***" for field,
-                                  value in zip(cursor.column_names, row))
+    if mode == "parallel":
+        workers = int(os.getenv("PERSONAL_DATA_EXPORT_WORKERS", "0"))
+        key = os.getenv("PERSONAL_DATA_EXPORT_KEY", "id")
+        export_users_parallel(sys.stderr, workers or None, key, batch_size)
+        return
+
+    db = get_db()
+    if mode == "stream":
+        export_users(db, sys.stderr, batch_size)
+    else:
+        cursor = db.cursor()
+        cursor.execute("SELECT * FROM users;")
         logger = get_logger()
-        logger.info(formatted_row)
+        if os.getenv("PERSONAL_DATA_LOG_FORMAT", "text") == "json":
+            columns = [column[0] for column in cursor.description]
+            for rows in iter(lambda: cursor.fetchmany(batch_size), []):
+                for row in rows:
+                    logger.info("user", dict(zip(columns, row)))
+        else:
+            for lines in redacted_rows(cursor, batch_size):
+                for line in lines:
+                    logger.info(line)
+        cursor.close()
 
-    cursor.close()
     db.close()
 
 
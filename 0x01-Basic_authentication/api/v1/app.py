@@ -3,15 +3,56 @@
 Route module for the API
 """
 from os import getenv
+from api.v1.compression import compress_response
+from api.v1.json_provider import ORJSON_AVAILABLE, OrjsonProvider
 from api.v1.views import app_views
 from flask import Flask, jsonify, abort, request
 from flask_cors import (CORS, cross_origin)
+from models.user import User
 import os
 
 
 app = Flask(__name__)
+if ORJSON_AVAILABLE and getenv("API_JSON", "orjson") == "orjson":
+    app.json = OrjsonProvider(app)
 app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
+auth = None
+if getenv("AUTH_TYPE") == "basic_auth":
+    from api.v1.auth.basic_auth import BasicAuth
+    auth = BasicAuth()
+elif getenv("AUTH_TYPE") == "auth":
+    from api.v1.auth.auth import Auth
+    auth = Auth()
+
+EXCLUDED_PATHS = ['/api/v1/status/', '/api/v1/unauthorized/',
+                  '/api/v1/forbidden/']
+
+
+@app.before_request
+def refresh_data():
+    """ Catch up with the changes of the other workers (DB_SHARED=1)
+    """
+    User.refresh()
+
+
+@app.before_request
+def authenticate():
+    """ Reject requests without valid credentials when AUTH_TYPE is set
+    """
+    if auth is None or not auth.require_auth(request.path, EXCLUDED_PATHS):
+        return
+    if auth.authorization_header(request) is None:
+        abort(401)
+    if auth.current_user(request) is None:
+        abort(403)
+
+
+@app.after_request
+def compress(response):
+    """ Gzip large responses for clients that accept it
+    """
+    return compress_response(request, response)
 
 
 @app.errorhandler(404)
@@ -28,6 +69,13 @@ def unauthorized(error) -> str:
     return jsonify({"error": "Unauthorized"}), 401
 
 
+@app.errorhandler(403)
+def forbidden(error) -> str:
+    """ Forbidden handler
+    """
+    return jsonify({"error": "Forbidden"}), 403
+
+
 if __name__ == "__main__":
     host = getenv("API_HOST", "0.0.0.0")
     port = getenv("API_PORT", "5000")
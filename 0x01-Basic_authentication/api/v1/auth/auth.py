@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+""" Module of the API authentication
+"""
+from typing import List, TypeVar
+
+
+class Auth():
+    """ Template of the authentication systems
+    """
+
+    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+        """ Tell whether `path` needs authentication
+        Paths match with or without their trailing slash; an excluded
+        path ending with * matches every path it prefixes
+        """
+        if path is None or not excluded_paths:
+            return True
+        path = path.rstrip('/') + '/'
+        for excluded_path in excluded_paths:
+            if excluded_path.endswith('*'):
+                if path.startswith(excluded_path[:-1]):
+                    return False
+            elif path == excluded_path.rstrip('/') + '/':
+                return False
+        return True
+
+    def authorization_header(self, request=None) -> str:
+        """ Value of the Authorization header of `request`, None if
+        missing
+        """
+        if request is None:
+            return None
+        return request.headers.get('Authorization')
+
+    def current_user(self, request=None) -> TypeVar('User'):
+        """ User authenticated by `request`
+        """
+        return None
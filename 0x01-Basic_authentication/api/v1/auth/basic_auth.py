@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+""" Module of the Basic authentication
+"""
+from api.v1.auth.auth import Auth
+from collections import OrderedDict
+from models.user import User
+from os import getenv
+from typing import Tuple, TypeVar
+import base64
+import binascii
+import hashlib
+import threading
+import time
+
+
+class CredentialCache():
+    """ Bounded, TTL-limited cache of resolved Authorization headers
+    Entries are keyed by the SHA-256 of the header and hold the user id
+    with the email and password hash it was resolved against; a hit is
+    only served while the user still exists with both unchanged, so
+    password changes and removals invalidate it.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        """ Initialize a CredentialCache
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, header: str) -> TypeVar('User'):
+        """ User resolved from `header`, None on a miss
+        """
+        key = hashlib.sha256(header.encode()).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+        user = None
+        if entry is not None and entry[0] > time.monotonic():
+            user = User.get(entry[1])
+            if user is not None and (user.email, user.password) != \
+                    entry[2:]:
+                user = None
+        with self._lock:
+            if user is None:
+                self.misses += 1
+                if entry is not None and self._entries.get(key) is entry:
+                    del self._entries[key]
+                return None
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return user
+
+    def add(self, header: str, user: TypeVar('User')):
+        """ Remember that `header` resolves to `user`
+        """
+        key = hashlib.sha256(header.encode()).digest()
+        entry = (time.monotonic() + self.ttl, user.id, user.email,
+                 user.password)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """ Drop every entry
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """ Counters of the cache
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+class BasicAuth(Auth):
+    """ Basic authentication
+    Resolved credentials are cached, up to AUTH_CACHE_SIZE headers
+    (0 disables the cache) for AUTH_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        """ Initialize a BasicAuth
+        """
+        maxsize = int(getenv("AUTH_CACHE_SIZE", "1024"))
+        ttl = float(getenv("AUTH_CACHE_TTL", "300"))
+        self.cache = CredentialCache(maxsize, ttl) if maxsize > 0 else None
+
+    def extract_base64_authorization_header(self,
+                                            authorization_header: str
+                                            ) -> str:
+        """ Base64 part of a Basic Authorization header
+        """
+        if type(authorization_header) is not str:
+            return None
+        if not authorization_header.startswith("Basic "):
+            return None
+        return authorization_header[len("Basic "):]
+
+    def decode_base64_authorization_header(self,
+                                           base64_authorization_header: str
+                                           ) -> str:
+        """ Decoded value of a Base64 string, None if it is invalid
+        """
+        if type(base64_authorization_header) is not str:
+            return None
+        try:
+            decoded = base64.b64decode(base64_authorization_header,
+                                       validate=True)
+            return decoded.decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+
+    def extract_user_credentials(self,
+                                 decoded_base64_authorization_header: str
+                                 ) -> Tuple[str, str]:
+        """ Email and password of a decoded Basic credential
+        """
+        decoded = decoded_base64_authorization_header
+        if type(decoded) is not str or ':' not in decoded:
+            return None, None
+        email, pwd = decoded.split(':', 1)
+        return email, pwd
+
+    def user_object_from_credentials(self, user_email: str,
+                                     user_pwd: str) -> TypeVar('User'):
+        """ User with this email and password, None if there is none
+        """
+        if type(user_email) is not str or type(user_pwd) is not str:
+            return None
+        try:
+            users = User.search({'email': user_email})
+        except Exception:
+            return None
+        for user in users:
+            if user.is_valid_password(user_pwd):
+                return user
+        return None
+
+    def current_user(self, request=None) -> TypeVar('User'):
+        """ User authenticated by the Authorization header of `request`
+        """
+        header = self.authorization_header(request)
+        if header is None:
+            return None
+        if self.cache is not None:
+            user = self.cache.get(header)
+            if user is not None:
+                return user
+        base64_header = self.extract_base64_authorization_header(header)
+        decoded = self.decode_base64_authorization_header(base64_header)
+        email, pwd = self.extract_user_credentials(decoded)
+        user = self.user_object_from_credentials(email, pwd)
+        if user is not None and self.cache is not None:
+            self.cache.add(header, user)
+        return user
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+""" Module of the response compression of the API
+"""
+from flask import Request, Response
+from os import getenv
+import gzip
+
+GZIP_MIN_SIZE = int(getenv("API_GZIP_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(getenv("API_GZIP_LEVEL", "6"))
+GZIP_ETAG_SUFFIX = "-gzip"
+
+
+def compress_response(request: Request, response: Response) -> Response:
+    """ Gzip the body of `response` when the client accepts it and the
+    body holds at least GZIP_MIN_SIZE bytes (0 disables compression)
+    Streamed responses are left alone; a compressed response gets its
+    own strong ETag, ending with GZIP_ETAG_SUFFIX.
+    """
+    if GZIP_MIN_SIZE <= 0 or response.status_code != 200 or \
+            response.direct_passthrough or response.is_streamed or \
+            'Content-Encoding' in response.headers:
+        return response
+    if response.content_length is not None and \
+            response.content_length < GZIP_MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+
+    data = gzip.compress(response.get_data(), GZIP_LEVEL, mtime=0)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(etag + GZIP_ETAG_SUFFIX, weak)
+    return response
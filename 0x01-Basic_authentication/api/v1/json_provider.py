@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+""" Module of the JSON provider of the API
+"""
+from flask.json.provider import DefaultJSONProvider
+from flask import Response
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_AVAILABLE = orjson is not None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """ JSON provider encoding and decoding with orjson
+    Output matches the default provider up to whitespace and escaping:
+    keys are sorted and converted to strings, and values orjson does
+    not handle itself (dates, Decimal...) go through the default
+    provider's `default`. Calls with json.dumps options, and values
+    orjson rejects, fall back to the default provider.
+    """
+
+    def _encode(self, obj: Any) -> bytes:
+        """ Encode `obj` with orjson
+        """
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME \
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        """ Serialize data as JSON to a string
+        """
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return self._encode(obj).decode()
+        except TypeError:
+            return super().dumps(obj)
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        """ Deserialize data as JSON from a string or bytes
+        """
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        """ Serialize the arguments as a JSON response, without going
+        through str
+        """
+        if (self.compact is None and self._app.debug) or \
+                self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            data = self._encode(obj)
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(data + b"\n",
+                                        mimetype=self.mimetype)
@@ -1,19 +1,188 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
+from api.v1.compression import GZIP_ETAG_SUFFIX
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, current_app, jsonify, request
 from models.user import User
+from typing import List, Tuple
+import base64
+import binascii
+
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 100
+MAX_BULK_SIZE = 100000
+
+
+def encode_cursor(user_id: str) -> str:
+    """ Opaque pagination cursor pointing after `user_id`
+    """
+    return base64.urlsafe_b64encode(user_id.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> str:
+    """ User ID of a pagination cursor, None if it is invalid
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        user_id = base64.b64decode(cursor + padding, altchars=b'-_',
+                                   validate=True).decode()
+    except (binascii.Error, ValueError):
+        return None
+    return user_id or None
+
+
+def stream_users() -> Response:
+    """ Stream the JSON list of all users, a few users per chunk
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield '['
+        chunk = []
+        separator = ''
+        for user in User.iter_all():
+            chunk.append(separator + dumps(user.to_json()))
+            separator = ','
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk) + ']\n'
+
+    return Response(generate(), mimetype='application/json')
+
+
+def not_modified(etag: str) -> Response:
+    """ 304 response if the request already holds `etag`, or the tag
+    of its compressed variant, else None
+    """
+    for tag in (etag, etag + GZIP_ETAG_SUFFIX):
+        if request.if_none_match.contains(tag):
+            response = current_app.response_class(status=304)
+            response.set_etag(tag)
+            return response
+    return None
+
+
+def new_user(rj: dict) -> Tuple[dict, int]:
+    """ Create and save a User from its JSON body
+    Return the User object JSON represented and 201, or the error
+    and 400
+    """
+    error_msg = None
+    if type(rj) is not dict:
+        error_msg = "Wrong format"
+    if error_msg is None and rj.get("email", "") == "":
+        error_msg = "email missing"
+    if error_msg is None and rj.get("password", "") == "":
+        error_msg = "password missing"
+    if error_msg is None:
+        try:
+            user = User()
+            user.email = rj.get("email")
+            user.password = rj.get("password")
+            user.first_name = rj.get("first_name")
+            user.last_name = rj.get("last_name")
+            user.save()
+            return user.to_json(), 201
+        except Exception as e:
+            error_msg = "Can't create User: {}".format(e)
+    return {'error': error_msg}, 400
+
+
+def change_user(user: User, rj: dict) -> Tuple[dict, int]:
+    """ Update and save a User from its JSON body
+    Return the User object JSON represented and 200, or the error
+    and 400
+    """
+    if type(rj) is not dict:
+        return {'error': "Wrong format"}, 400
+    if rj.get('first_name') is not None:
+        user.first_name = rj.get('first_name')
+    if rj.get('last_name') is not None:
+        user.last_name = rj.get('last_name')
+    user.save()
+    return user.to_json(), 200
+
+
+def bulk_items() -> List:
+    """ JSON list of the request, None if it is not a list or holds
+    more than MAX_BULK_SIZE items
+    """
+    try:
+        items = request.get_json()
+    except Exception:
+        items = None
+    if type(items) is not list or len(items) > MAX_BULK_SIZE:
+        return None
+    return items
+
+
+def bulk_result(body: dict, status: int) -> dict:
+    """ Result of one item of a bulk request
+    """
+    if status >= 400:
+        return {'status': status, 'error': body.get('error')}
+    return {'status': status, 'user': body}
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: page size (at most MAX_PAGE_SIZE), enables pagination
+      - cursor: `next_cursor` of the previous page
+      - stream: 1 to stream the list as it is serialized
     Return:
       - list of all User objects JSON represented
+      - with limit: {"users": [...], "next_cursor": cursor or null}
+      - 400 if limit or cursor is invalid
+      - 304 if If-None-Match holds the ETag of the Users
+    """
+    # taken before reading: a change meanwhile makes the tag stale,
+    # never the body
+    etag = User.class_etag()
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    response = view_users()
+    if response.status_code == 200:
+        response.set_etag(etag)
+    return response
+
+
+def view_users() -> Response:
+    """ Response of GET /api/v1/users
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    if request.args.get('limit') is None:
+        if request.args.get('stream') in ('1', 'true'):
+            return stream_users()
+        all_users = [user.to_json() for user in User.all()]
+        return jsonify(all_users)
+
+    try:
+        limit = int(request.args.get('limit'))
+    except ValueError:
+        limit = 0
+    if limit <= 0 or limit > MAX_PAGE_SIZE:
+        response = jsonify({'error': "Invalid limit"})
+        response.status_code = 400
+        return response
+    after = None
+    if request.args.get('cursor'):
+        after = decode_cursor(request.args.get('cursor'))
+        if after is None:
+            response = jsonify({'error': "Invalid cursor"})
+            response.status_code = 400
+            return response
+
+    users = User.page(limit + 1, after)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(users[-1].id)
+    return jsonify({'users': [user.to_json() for user in users],
+                    'next_cursor': next_cursor})
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -24,13 +193,20 @@ def view_one_user(user_id: str = None) -> str:
     Return:
       - User object JSON represented
       - 404 if the User ID doesn't exist
+      - 304 if If-None-Match holds the ETag of the User
     """
     if user_id is None:
         abort(404)
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    etag = user.etag()
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    response = jsonify(user.to_json())
+    response.set_etag(etag)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -64,29 +240,12 @@ def create_user() -> str:
       - 400 if can't create the new User
     """
     rj = None
-    error_msg = None
     try:
         rj = request.get_json()
     except Exception as e:
         rj = None
-    if rj is None:
-        error_msg = "Wrong format"
-    if error_msg is None and rj.get("email", "") == "":
-        error_msg = "email missing"
-    if error_msg is None and rj.get("password", "") == "":
-        error_msg = "password missing"
-    if error_msg is None:
-        try:
-            user = User()
-            user.email = rj.get("email")
-            user.password = rj.get("password")
-            user.first_name = rj.get("first_name")
-            user.last_name = rj.get("last_name")
-            user.save()
-            return jsonify(user.to_json()), 201
-        except Exception as e:
-            error_msg = "Can't create User: {}".format(e)
-    return jsonify({'error': error_msg}), 400
+    body, status = new_user(rj)
+    return jsonify(body), status
 
 
 @app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
@@ -112,11 +271,80 @@ def update_user(user_id: str = None) -> str:
         rj = request.get_json()
     except Exception as e:
         rj = None
-    if rj is None:
+    body, status = change_user(user, rj)
+    return jsonify(body), status
+
+
+@app_views.route('/users/bulk', methods=['POST'], strict_slashes=False)
+def create_users() -> str:
+    """ POST /api/v1/users/bulk
+    JSON body:
+      - list of User JSON bodies, as for POST /api/v1/users
+    Return:
+      - {"results": [...]}, one {"status": 201, "user": {...}} or
+        {"status": 400, "error": ...} per item, in order
+      - 400 if the body is not a list of at most MAX_BULK_SIZE items
+    All Users are persisted with a single write
+    """
+    items = bulk_items()
+    if items is None:
         return jsonify({'error': "Wrong format"}), 400
-    if rj.get('first_name') is not None:
-        user.first_name = rj.get('first_name')
-    if rj.get('last_name') is not None:
-        user.last_name = rj.get('last_name')
-    user.save()
-    return jsonify(user.to_json()), 200
+    with User.batch():
+        results = [bulk_result(*new_user(rj)) for rj in items]
+    return jsonify({'results': results}), 200
+
+
+@app_views.route('/users/bulk', methods=['PUT'], strict_slashes=False)
+def update_users() -> str:
+    """ PUT /api/v1/users/bulk
+    JSON body:
+      - list of {"id": ..., "first_name": ..., "last_name": ...}, names
+        optional
+    Return:
+      - {"results": [...]}, one {"status": 200, "user": {...}} or
+        {"status": 400 or 404, "error": ...} per item, in order
+      - 400 if the body is not a list of at most MAX_BULK_SIZE items
+    All Users are persisted with a single write
+    """
+    items = bulk_items()
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    results = []
+    with User.batch():
+        for rj in items:
+            user = None
+            if type(rj) is dict and type(rj.get('id')) is str:
+                user = User.get(rj.get('id'))
+            if type(rj) is not dict:
+                results.append(bulk_result({'error': "Wrong format"}, 400))
+            elif user is None:
+                results.append(bulk_result({'error': "Not found"}, 404))
+            else:
+                results.append(bulk_result(*change_user(user, rj)))
+    return jsonify({'results': results}), 200
+
+
+@app_views.route('/users/bulk', methods=['DELETE'], strict_slashes=False)
+def delete_users() -> str:
+    """ DELETE /api/v1/users/bulk
+    JSON body:
+      - list of User IDs
+    Return:
+      - {"results": [...]}, one {"status": 200} or {"status": 404,
+        "error": "Not found"} per item, in order
+      - 400 if the body is not a list of at most MAX_BULK_SIZE items
+    All removals are persisted with a single write
+    """
+    items = bulk_items()
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    results = []
+    with User.batch():
+        for user_id in items:
+            user = User.get(user_id) if type(user_id) is str else None
+            if user is None:
+                results.append({'status': 404, 'error': "Not found"})
+                continue
+            user.remove()
+            results.append({'status': 200})
+    return jsonify({'results': results}), 200
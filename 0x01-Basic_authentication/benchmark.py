@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+""" Benchmarks of the models storage
+
+Usage: ./benchmark.py [--sizes 10000,100000,1000000]
+                      [--memory-size 1000000] [--threads 8]
+                      [--storage-size 10000] [--listing-size 10000]
+                      [--hydration-size 100000]
+                      [--json FILE]
+
+Every case reports its throughput and p50/p99 latency; `--json` writes
+the results keyed by case name so runs can be compared.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from models import base
+from models.base import DATA
+from models.storage import SQLiteStorage
+from models.user import User
+
+
+def make_records(count: int) -> List[dict]:
+    """ Build `count` serialized users
+    """
+    return [{
+        'id': "{:08d}-0000-4000-8000-000000000000".format(i),
+        'created_at': "2024-01-01T00:00:00",
+        'updated_at': "2024-01-01T00:00:00",
+        'email': "user{}@example.com".format(i),
+        '_password': "0" * 64,
+        'first_name': "First{}".format(i % 100),
+        'last_name': "Last{}".format(i % 1000),
+    } for i in range(count)]
+
+
+def populate(records: List[dict]):
+    """ Replace the stored users by `records`, without touching files
+    """
+    DATA['User'] = {}
+    for record in records:
+        DATA['User'][record['id']] = User(**record)
+    User.rebuild_indexes()
+
+
+def measure(func: Callable, items: List, unit: str) -> Dict:
+    """ Time `func` on every item
+    """
+    clock = time.perf_counter_ns
+    timings = []
+    for item in items:
+        start = clock()
+        func(item)
+        timings.append(clock() - start)
+    timings.sort()
+    total = sum(timings) or 1
+    return {
+        unit: len(items) * 1e9 / total,
+        "p50_us": timings[len(timings) // 2] / 1000,
+        "p99_us": timings[min(len(timings) - 1,
+                              len(timings) * 99 // 100)] / 1000,
+        "samples": len(items),
+    }
+
+
+def search_cases(size: int) -> Dict[str, Dict]:
+    """ Search users by email with and without the index
+    """
+    results = {}
+    records = make_records(size)
+    populate(records)
+    step = max(1, size // 1000)
+    emails = [records[i]['email'] for i in range(0, size, step)]
+    results["search/email/indexed/n={}".format(size)] = measure(
+        lambda email: User.search({'email': email}), emails,
+        "lookups_per_sec")
+
+    indexed, User.indexed_attributes = User.indexed_attributes, ()
+    User.rebuild_indexes()
+    results["search/email/scan/n={}".format(size)] = measure(
+        lambda email: User.search({'email': email}), emails[:20],
+        "lookups_per_sec")
+    User.indexed_attributes = indexed
+    User.rebuild_indexes()
+    return results
+
+
+def hydration_cases(size: int) -> Dict[str, Dict]:
+    """ Build users from decoded records one by one with User(**record)
+    and in bulk with User.from_records, then load them from a file
+    """
+    results = {}
+    records = make_records(size)
+    chunks = [records[i:i + 1000] for i in range(0, size, 1000)]
+    for name, build in (
+            ("init", lambda chunk: [User(**record) for record in chunk]),
+            ("from_records", User.from_records)):
+        result = measure(build, chunks, "objects_per_sec")
+        result["objects_per_sec"] *= 1000
+        results["hydration/{}/n={}".format(name, size)] = result
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            with open(".db_User.json", "w") as f:
+                json.dump({record['id']: record for record in records}, f)
+            result = measure(lambda _: User.load_from_file(), range(3),
+                             "objects_per_sec")
+            result["objects_per_sec"] *= size
+            results["hydration/load_from_file/n={}".format(size)] = result
+        finally:
+            DATA['User'] = {}
+            os.chdir(cwd)
+    return results
+
+
+def memory_case(size: int) -> Dict[str, Dict]:
+    """ Resident bytes per user once `size` users are loaded from JSON
+    """
+    text = json.dumps({record['id']: record
+                       for record in make_records(size)})
+    DATA['User'] = {}
+    gc.collect()
+    tracemalloc.start()
+    for obj_id, record in json.loads(text).items():
+        DATA['User'][obj_id] = User(**record)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    DATA['User'] = {}
+    return {"memory/n={}".format(size): {
+        "bytes_per_user": current / size,
+        "peak_bytes_per_user": peak / size,
+        "samples": size,
+    }}
+
+
+def storage_cases(size: int) -> Dict[str, Dict]:
+    """ Save, get and search users with the JSON files, journaled, and
+    with the SQLite backend
+    """
+    results = {}
+    records = make_records(size)
+    step = max(1, size // 1000)
+    sample = records[::step]
+    cwd = os.getcwd()
+    saved = (base.STORAGE, base.JOURNAL_ENABLED)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            backends = (
+                ("json", None),
+                ("sqlite", SQLiteStorage(os.path.join(directory, "db"))),
+            )
+            for name, storage in backends:
+                base.STORAGE, base.JOURNAL_ENABLED = storage, True
+                DATA['User'] = {}
+                User.load_from_file()
+                users = [User(**record) for record in records]
+                results["storage/{}/save/n={}".format(name, size)] = \
+                    measure(lambda user: user.save(), users,
+                            "writes_per_sec")
+                batches = [[{'op': 'put', 'obj': user.to_json(True)}
+                            for user in users[i:i + 100]]
+                           for i in range(0, len(users), 100)]
+                result = measure(User.write_changes, batches,
+                                 "writes_per_sec")
+                result["writes_per_sec"] *= 100
+                results["storage/{}/save_batch_100/n={}".format(
+                    name, size)] = result
+                results["storage/{}/get/n={}".format(name, size)] = \
+                    measure(lambda record: User.get(record['id']), sample,
+                            "lookups_per_sec")
+                results["storage/{}/search/email/n={}".format(
+                    name, size)] = measure(
+                        lambda record: User.search(
+                            {'email': record['email']}),
+                        sample, "lookups_per_sec")
+        finally:
+            base.STORAGE, base.JOURNAL_ENABLED = saved
+            DATA['User'] = {}
+            os.chdir(cwd)
+    return results
+
+
+def concurrency_case(threads: int, per_thread: int = 200) -> Dict[str, Dict]:
+    """ Stress the store from `threads` writers and as many readers
+    Every writer saves, updates and removes its own users while readers
+    search, list and snapshot; the store and its file must end up with
+    exactly the surviving users, else RuntimeError is raised.
+    stress_test.py checks the same without timing it
+    """
+    cwd = os.getcwd()
+    errors = []
+    timings = []
+    expected = {}
+    done = threading.Event()
+
+    def writer(number: int):
+        try:
+            clock = time.perf_counter_ns
+            for i in range(per_thread):
+                user = User(email="w{}-{}@example.com".format(number, i))
+                start = clock()
+                user.save()
+                timings.append(clock() - start)
+                if i % 3 == 0:
+                    user.first_name = "Updated"
+                    user.save()
+                if i % 5 == 0:
+                    user.remove()
+                else:
+                    expected[user.id] = user.first_name
+        except Exception as e:
+            errors.append(e)
+
+    def reader(number: int):
+        try:
+            while not done.is_set():
+                User.search({'email': "w{}-0@example.com".format(number)})
+                User.all()
+                User.count()
+                for _ in User.iter_all():
+                    pass
+                if number == 0:
+                    User.save_to_file()
+        except Exception as e:
+            errors.append(e)
+
+    storage = base.STORAGE
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            if storage is not None:
+                base.STORAGE = type(storage)(os.path.join(directory, "db"))
+            DATA['User'] = {}
+            User.load_from_file()
+            User.rebuild_indexes()
+            writers = [threading.Thread(target=writer, args=(n,))
+                       for n in range(threads)]
+            readers = [threading.Thread(target=reader, args=(n,))
+                       for n in range(threads)]
+            start = time.perf_counter()
+            for thread in readers + writers:
+                thread.start()
+            for thread in writers:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            done.set()
+            for thread in readers:
+                thread.join()
+
+            if errors:
+                raise RuntimeError("stress failed: {!r}".format(errors))
+            stored = {user.id: user.first_name for user in User.all()}
+            if stored != expected:
+                raise RuntimeError("lost writes in memory")
+            User.load_from_file()
+            stored = {user.id: user.first_name for user in User.all()}
+            if stored != expected:
+                raise RuntimeError("lost writes on disk")
+        finally:
+            base.STORAGE = storage
+            DATA['User'] = {}
+            os.chdir(cwd)
+
+    timings.sort()
+    return {"concurrency/threads={}".format(threads): {
+        "writes_per_sec": len(timings) / elapsed,
+        "p50_us": timings[len(timings) // 2] / 1000,
+        "p99_us": timings[len(timings) * 99 // 100] / 1000,
+        "samples": len(timings),
+    }}
+
+
+def listing_cases(size: int) -> Dict[str, Dict]:
+    """ Serialize GET /api/v1/users for `size` users with each JSON
+    provider, and send it with and without gzip
+    """
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            from api.v1.app import app
+            from api.v1.json_provider import ORJSON_AVAILABLE, \
+                OrjsonProvider
+            from flask.json.provider import DefaultJSONProvider
+            populate(make_records(size))
+            objs = [user.to_json() for user in User.all()]
+            providers = [("std", DefaultJSONProvider(app))]
+            if ORJSON_AVAILABLE:
+                providers.append(("orjson", OrjsonProvider(app)))
+            default_provider = app.json
+            client = app.test_client()
+            for name, provider in providers:
+                app.json = provider
+                with app.app_context():
+                    results["listing/{}/serialize/n={}".format(
+                        name, size)] = measure(
+                            lambda _: provider.response(objs), range(20),
+                            "listings_per_sec")
+                for encoding in ("identity", "gzip"):
+                    sizes = []
+                    result = measure(
+                        lambda _: sizes.append(len(client.get(
+                            "/api/v1/users",
+                            headers={"Accept-Encoding": encoding}).data)),
+                        range(10), "listings_per_sec")
+                    result["bytes"] = sizes[-1]
+                    results["listing/{}/get/{}/n={}".format(
+                        name, encoding, size)] = result
+            app.json = default_provider
+        finally:
+            DATA['User'] = {}
+            os.chdir(cwd)
+    return results
+
+
+def main():
+    """ Run the cases and report them
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--memory-size", type=int, default=100000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--storage-size", type=int, default=10000)
+    parser.add_argument("--listing-size", type=int, default=10000)
+    parser.add_argument("--hydration-size", type=int, default=100000)
+    parser.add_argument("--json", metavar="FILE")
+    args = parser.parse_args()
+
+    results = {}
+    for size in [int(size) for size in args.sizes.split(",")]:
+        results.update(search_cases(size))
+    if args.hydration_size:
+        results.update(hydration_cases(args.hydration_size))
+    if args.memory_size:
+        results.update(memory_case(args.memory_size))
+    if args.threads:
+        results.update(concurrency_case(args.threads))
+    if args.storage_size:
+        results.update(storage_cases(args.storage_size))
+    if args.listing_size:
+        results.update(listing_cases(args.listing_size))
+
+    for name, result in results.items():
+        if "bytes_per_user" in result:
+            print("{:<40} {:>12,.0f} bytes/user   peak {:>10,.0f} bytes/user"
+                  .format(name, result["bytes_per_user"],
+                          result["peak_bytes_per_user"]))
+            continue
+        unit = next(key for key in result if key.endswith("_per_sec"))
+        print("{:<40} {:>12,.0f} {:<12} p50 {:>10.1f}us  p99 {:>10.1f}us"
+              .format(name, result[unit], unit.replace("_per_", "/"),
+                      result["p50_us"], result["p99_us"]), end="")
+        if "bytes" in result:
+            print("  {:>10,} bytes".format(result["bytes"]), end="")
+        print()
+
+    if args.json:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "argv": sys.argv[1:],
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,463 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import TypeVar, List, Iterable, Iterator, Tuple
+from os import getenv, path
+import atexit
+import fcntl
+import heapq
+import itertools
 import json
+import os
+import sys
+import threading
+import traceback
 import uuid
 
+from models.storage import STORAGES
+
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
 
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+_MISSING = object()
+
+FAST_START = getenv("DB_FAST_START", "0") == "1"
+
+JOURNAL_ENABLED = getenv("DB_JOURNAL", "0") == "1"
+JOURNAL_COMPACT_THRESHOLD = int(getenv("DB_JOURNAL_COMPACT_THRESHOLD", "1000"))
+JOURNAL_SIZES = {}
+INDEXES = {}
+INDEXED_VALUES = {}
+
+WRITE_BEHIND_INTERVAL = float(getenv("DB_WRITE_BEHIND_INTERVAL", "0"))
+WRITE_BEHIND_MAX_PENDING = int(getenv("DB_WRITE_BEHIND_MAX_PENDING", "1000"))
+FSYNC = getenv("DB_FSYNC", "0") == "1"
+
+STORAGE_NAME = getenv("DB_STORAGE", "file")
+STORAGE = None
+if STORAGE_NAME != "file":
+    STORAGE = STORAGES[STORAGE_NAME](
+        getenv("DB_STORAGE_PATH", ".db.sqlite3"), FSYNC)
+
+PENDING = {}
+FLUSHING = {}
+LOCKS = {}
+_locks_guard = threading.Lock()
+_file_lock = threading.RLock()
+
+SHARED = getenv("DB_SHARED", "0") == "1"
+SNAPSHOTS = {}
+JOURNAL_OFFSETS = {}
+_flocks = {}
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_requested = threading.Event()
+_flusher = None
+_batch = threading.local()
+
+GENERATIONS = {}
+BOOT_TOKEN = None
+_stamps = itertools.count(1)
+
+
+def flush():
+    """ Write the pending changes of every class
+    Each class costs one snapshot write, or one journal append with
+    DB_JOURNAL=1, however many changes are pending
+    """
+    with _flush_lock:
+        with _pending_lock:
+            pending = list(PENDING.values())
+            PENDING.clear()
+        for index, (cls, entries) in enumerate(pending):
+            with _pending_lock:
+                FLUSHING[cls.__name__] = entries
+            try:
+                cls.write_changes(entries)
+            except BaseException:
+                # keep the unwritten changes ahead of newer ones
+                with _pending_lock:
+                    for unwritten, older in pending[index:]:
+                        s_class = unwritten.__name__
+                        newer = PENDING.pop(s_class, (unwritten, []))[1]
+                        PENDING[s_class] = (unwritten, older + newer)
+                raise
+            finally:
+                with _pending_lock:
+                    FLUSHING.pop(cls.__name__, None)
+
+
+def _flush_loop():
+    """ Flush every WRITE_BEHIND_INTERVAL seconds, or sooner when asked
+    """
+    while True:
+        _flush_requested.wait(WRITE_BEHIND_INTERVAL)
+        _flush_requested.clear()
+        try:
+            flush()
+        except Exception:
+            traceback.print_exc()
+
+
+def _start_flusher():
+    """ Start the write-behind thread of this process once
+    """
+    global _flusher
+    if _flusher is None or _flusher[0] != os.getpid():
+        thread = threading.Thread(target=_flush_loop, daemon=True,
+                                  name="models-write-behind")
+        _flusher = (os.getpid(), thread)
+        thread.start()
+
+
+def _fsync_directory(directory: str):
+    """ Make a rename in `directory` durable
+    """
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+atexit.register(flush)
+
+
+def _new_boot_token():
+    """ Give this process its own entity tag token
+    Generations and stamps count separately in each process, forked
+    workers included, so the tags of two processes must never match
+    """
+    global BOOT_TOKEN
+    BOOT_TOKEN = uuid.uuid4().hex[:8]
+
+
+_new_boot_token()
+os.register_at_fork(after_in_child=_new_boot_token)
+
+
+def _file_signature(file_path: str) -> Tuple[int, int, int]:
+    """ Inode, modification time and size of a file, None if missing
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class RWLock():
+    """ Reader-writer lock that lets any number of readers in, or one
+    writer; waiting writers hold new readers back.
+    A thread may take the read lock again while it holds the read or the
+    write lock, and the write lock again while it holds it, but may not
+    upgrade a read lock to the write lock.
+    """
+
+    def __init__(self):
+        """ Initialize an unlocked RWLock
+        """
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = {}
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        """ Block until the calling thread may read
+        """
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me or me in self._readers:
+                self._readers[me] = self._readers.get(me, 0) + 1
+                return
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers[me] = 1
+
+    def release_read(self):
+        """ Release one read of the calling thread
+        """
+        me = threading.get_ident()
+        with self._cond:
+            count = self._readers[me] - 1
+            if count:
+                self._readers[me] = count
+                return
+            del self._readers[me]
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """ Block until the calling thread is the only one in
+        """
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writes += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("cannot upgrade a read lock")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._writes = 1
+
+    def release_write(self):
+        """ Release one write of the calling thread
+        """
+        with self._cond:
+            self._writes -= 1
+            if self._writes == 0:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def reading(self):
+        """ Hold the read lock within a with block
+        """
+        self.acquire_read()
+        try:
+            yield self
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        """ Hold the write lock within a with block
+        """
+        self.acquire_write()
+        try:
+            yield self
+        finally:
+            self.release_write()
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+    datetime.fromisoformat reads this layout far faster than strptime
+    """
+    if len(value) == 19 and value[10] == 'T':
+        return datetime.fromisoformat(value)
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def to_epoch(value: datetime) -> int:
+    """ Whole seconds between the epoch and a naive UTC datetime
+    """
+    return (value - _EPOCH) // _SECOND
+
+
+def from_epoch(value: int) -> datetime:
+    """ Naive UTC datetime of a number of seconds since the epoch
+    """
+    if value is None:
+        return None
+    return _EPOCH + timedelta(seconds=value)
+
+
+class LazyObjects(MutableMapping):
+    """ Objects of one class, hydrated from their records on first access
+    DATA is pointed back at a plain dict once every record has been
+    hydrated
+    """
+
+    def __init__(self, cls: type, records: dict):
+        """ Keep the decoded records of `cls` by id
+        """
+        self._cls = cls
+        self._items = records
+        self._pending = len(records)
+        self._lock = threading.Lock()
+
+    def __getitem__(self, obj_id: str):
+        """ Return the object, hydrating it if needed
+        """
+        obj = self._items[obj_id]
+        if type(obj) is not dict:
+            return obj
+        with self._lock:
+            # readers may race to hydrate the same record
+            obj = self._items[obj_id]
+            if type(obj) is dict:
+                obj = self._cls.from_records((obj,))[0]
+                self._items[obj_id] = obj
+                self._hydrated()
+        return obj
+
+    def __setitem__(self, obj_id: str, obj):
+        """ Store a hydrated object
+        """
+        with self._lock:
+            previous = self._items.get(obj_id)
+            self._items[obj_id] = obj
+            if type(previous) is dict:
+                self._hydrated()
+
+    def __delitem__(self, obj_id: str):
+        """ Remove an object
+        """
+        with self._lock:
+            previous = self._items.pop(obj_id)
+            if type(previous) is dict:
+                self._hydrated()
+
+    def __iter__(self):
+        """ Iterate over the ids
+        """
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        """ Number of objects, hydrated or not
+        """
+        return len(self._items)
+
+    def serialized_items(self) -> Iterator[Tuple[str, dict]]:
+        """ Yield (id, serialized object) without hydrating anything
+        """
+        for obj_id, obj in list(self._items.items()):
+            if type(obj) is dict:
+                yield obj_id, obj
+            else:
+                yield obj_id, obj.to_json(True)
+
+    def _hydrated(self):
+        """ Account for one record turned into an object; the lock
+        must be held
+        """
+        self._pending -= 1
+        if self._pending == 0:
+            s_class = self._cls.__name__
+            if DATA.get(s_class) is self:
+                DATA[s_class] = self._items
+
 
 class Base():
     """ Base class
+    Instances are slotted and keep their timestamps as integer seconds
+    since the epoch; `created_at` and `updated_at` read and write them
+    as datetimes. Subclasses declare their own `__slots__` and extend
+    `serialized_attributes`, which gives the to_json order, and may
+    list in `interned_attributes` the strings worth sharing. A class
+    whose __init__ only stores its serialized attributes declares
+    `hydrate_slots = True` in its own body, as subclasses do not
+    inherit it, so that from_records sets its slots directly.
+    to_json results and the entity tag are memoized until an attribute
+    is set.
+    The objects of each class are guarded by a reader-writer lock:
+    lookups and snapshots share it, changes take it exclusively.
+    With DB_SHARED=1 several processes share the files: writes lock
+    them against each other, and refresh() catches up with the changes
+    of the other processes.
+    DB_STORAGE=sqlite replaces the files and DATA by a storage backend
+    of models.storage, behind the same class methods.
     """
 
+    __slots__ = ('id', '_created_at', '_updated_at', '_json_cache')
+    serialized_attributes = ('id', 'created_at', 'updated_at')
+    indexed_attributes = ()
+    interned_attributes = ()
+    hydrate_slots = True
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+        DATA.setdefault(s_class, {})
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> List[TypeVar('Base')]:
+        """ Build objects from serialized records, as cls(**record) does,
+        without going through __init__
+        Slots are set directly and timestamps repeated across records
+        are parsed once. Classes that do not declare `hydrate_slots`
+        themselves are built through cls(**record) instead.
+        """
+        if not vars(cls).get('hydrate_slots', False):
+            return [cls(**record) for record in records]
+        DATA.setdefault(cls.__name__, {})
+        new = cls.__new__
+        setter = object.__setattr__
+        attributes = [attr for attr in cls.serialized_attributes
+                      if attr not in Base.serialized_attributes]
+        interned = cls.interned_attributes
+        epochs = {None: to_epoch(datetime.utcnow())}
+
+        def epoch(value) -> int:
+            """ Epoch of a timestamp string, now if it is None
+            """
+            result = epochs.get(value)
+            if result is None:
+                result = epochs[value] = to_epoch(parse_timestamp(value))
+            return result
+
+        objs = []
+        for record in records:
+            obj = new(cls)
+            get = record.get
+            setter(obj, 'id', record['id'] if 'id' in record
+                   else str(uuid.uuid4()))
+            setter(obj, '_created_at', epoch(get('created_at')))
+            setter(obj, '_updated_at', epoch(get('updated_at')))
+            for attr in attributes:
+                value = get(attr)
+                if attr in interned and type(value) is str:
+                    value = sys.intern(value)
+                setter(obj, attr, value)
+            setter(obj, '_json_cache', None)
+            objs.append(obj)
+        return objs
+
+    @property
+    def created_at(self) -> datetime:
+        """ Getter of the creation time
+        """
+        return from_epoch(self._created_at)
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        """ Setter of the creation time, kept to the second
+        """
+        self._created_at = None if value is None else to_epoch(value)
+
+    @property
+    def updated_at(self) -> datetime:
+        """ Getter of the last update time
+        """
+        return from_epoch(self._updated_at)
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        """ Setter of the last update time, kept to the second
+        """
+        self._updated_at = None if value is None else to_epoch(value)
+
+    def __setattr__(self, name: str, value):
+        """ Set an attribute and drop the memoized to_json results
+        """
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '_json_cache', None)
+
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
         """
@@ -46,9 +469,29 @@ class Base():
 
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
+        Each variant is computed once per state of the object; callers
+        get their own copy
+        """
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            cache = [None, None, None]
+            object.__setattr__(self, '_json_cache', cache)
+        result = cache[for_serialization]
+        if result is None:
+            result = cache[for_serialization] = \
+                self._to_json(for_serialization)
+        return dict(result)
+
+    def _to_json(self, for_serialization: bool) -> dict:
+        """ Build the JSON dictionary of the object
         """
         result = {}
-        for key, value in self.__dict__.items():
+        items = [(key, getattr(self, key, _MISSING))
+                 for key in self.serialized_attributes]
+        items.extend(getattr(self, '__dict__', {}).items())
+        for key, value in items:
+            if value is _MISSING:
+                continue
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -57,56 +500,559 @@ class Base():
                 result[key] = value
         return result
 
+    def etag(self) -> str:
+        """ Strong entity tag of the current state of the object
+        Each state gets a new stamp from a process-wide counter; with
+        a storage backend, objects are rebuilt on every lookup and the
+        tag follows the class generation instead
+        """
+        if STORAGE is not None:
+            return "{}-{}-{}".format(self.__class__.class_etag(), self.id,
+                                     self._updated_at)
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            cache = [None, None, None]
+            object.__setattr__(self, '_json_cache', cache)
+        if cache[2] is None:
+            cache[2] = next(_stamps)
+        return "{}-{}-{}".format(BOOT_TOKEN, self._updated_at, cache[2])
+
+    @classmethod
+    def class_etag(cls) -> str:
+        """ Strong entity tag of the objects of this class, which
+        changes with the class generation
+        """
+        storage = cls.storage()
+        if storage is not None:
+            return str(storage.generation(cls))
+        return "{}-{}".format(BOOT_TOKEN, GENERATIONS.get(cls.__name__, 0))
+
+    @classmethod
+    def _changed(cls):
+        """ Advance the generation of this class; the class lock must be
+        held for writing
+        """
+        s_class = cls.__name__
+        GENERATIONS[s_class] = GENERATIONS.get(s_class, 0) + 1
+
+    @classmethod
+    def lock(cls) -> RWLock:
+        """ Return the reader-writer lock of the objects of this class
+        """
+        s_class = cls.__name__
+        rw_lock = LOCKS.get(s_class)
+        if rw_lock is None:
+            with _locks_guard:
+                rw_lock = LOCKS.setdefault(s_class, RWLock())
+        return rw_lock
+
+    @classmethod
+    def storage(cls):
+        """ Return the storage backend once the pending changes of this
+        class are written to it, None when objects live in DATA
+        """
+        if STORAGE is not None and cls.__name__ in PENDING:
+            flush()
+        return STORAGE
+
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from file, then replay the journal
+        With DB_FAST_START=1 the file is only decoded: objects are
+        hydrated on first access and indexes built on first search.
+        With a storage backend, only prepare it; objects of the JSON
+        files are moved into it when it is empty.
+        """
+        s_class = cls.__name__
+        storage = cls.storage()
+        if storage is not None:
+            storage.load(cls)
+            if storage.count(cls) == 0:
+                cls._import_files(storage)
+            return
+        if s_class in PENDING:
+            # before locking: flush() takes the class lock itself
+            flush()
+        file_path = ".db_{}.json".format(s_class)
+        with cls.lock().writing():
+            DATA[s_class] = {}
+            SNAPSHOTS[s_class] = _file_signature(file_path)
+            if path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    if FAST_START:
+                        DATA[s_class] = LazyObjects(cls, json.load(f))
+                    else:
+                        objs_json = json.load(f)
+                        DATA[s_class] = dict(zip(
+                            objs_json,
+                            cls.from_records(objs_json.values())))
+            INDEXES.pop(s_class, None)
+            INDEXED_VALUES.pop(s_class, None)
+            JOURNAL_SIZES[s_class] = cls.replay_journal()
+            if not SHARED:
+                # with DB_SHARED=1 the tail may be another process's
+                # append in progress: appends cut it under the file lock
+                cls._truncate_journal()
+            if not FAST_START:
+                cls.rebuild_indexes()
+            cls._changed()
+
+    @classmethod
+    def _import_files(cls, storage):
+        """ Write the objects of the snapshot and journal of this class
+        to `storage`, in one batch
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        journal_path = ".db_{}.journal".format(s_class)
+        entries = []
+        if path.exists(file_path):
+            with open(file_path, 'r') as f:
+                entries.extend({'op': 'put', 'obj': obj_json}
+                               for obj_json in json.load(f).values())
+        if path.exists(journal_path):
+            with open(journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        break
+        if entries:
+            storage.write(cls, entries)
+
+    @classmethod
+    def replay_journal(cls, offset: int = 0) -> int:
+        """ Apply the journal entries from byte `offset` on top of the
+        loaded objects, and remember where they end
+        Return the number of entries applied
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        JOURNAL_OFFSETS[s_class] = offset
+        if not path.exists(journal_path):
+            JOURNAL_OFFSETS[s_class] = 0
+            return 0
+
+        count = 0
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # still being written, or torn
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn write at the tail of the journal
+                    break
+                cls._apply(entry)
+                offset += len(line)
+                count += 1
+        JOURNAL_OFFSETS[s_class] = offset
+        return count
+
+    @classmethod
+    def _truncate_journal(cls):
+        """ Cut the journal at the end of its last complete entry
+        A torn tail left by a crash would otherwise swallow the next
+        append, and every entry after it, on the next replay
+        """
+        journal_path = ".db_{}.journal".format(cls.__name__)
+        offset = JOURNAL_OFFSETS.get(cls.__name__, 0)
+        journal = _file_signature(journal_path)
+        if journal is not None and journal[2] > offset:
+            os.truncate(journal_path, offset)
+
+    @classmethod
+    def _apply(cls, entry: dict):
+        """ Apply one journal entry to the loaded objects
+        """
+        s_class = cls.__name__
+        if entry.get('op') == 'put':
+            obj = cls.from_records((entry.get('obj'),))[0]
+            DATA[s_class][obj.id] = obj
+            obj._index()
+        elif entry.get('op') == 'del':
+            obj = DATA[s_class].pop(entry.get('id'), None)
+            if isinstance(obj, Base):
+                obj._unindex()
+
+    @classmethod
+    def refresh(cls):
+        """ Catch up with the changes other processes wrote to the files
+        of this class, with DB_SHARED=1
+        Costs two stat calls when the files did not change; otherwise
+        only the journal tail is replayed, or, after a new snapshot,
+        only the objects whose record changed are rebuilt
+        """
+        s_class = cls.__name__
+        if not SHARED or STORAGE is not None or s_class not in SNAPSHOTS:
             return
+        journal = _file_signature(".db_{}.journal".format(s_class))
+        if _file_signature(".db_{}.json".format(s_class)) == \
+                SNAPSHOTS[s_class] and \
+                (journal[2] if journal else 0) == JOURNAL_OFFSETS[s_class]:
+            return
+        with cls.lock().writing():
+            cls._catch_up()
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def _catch_up(cls):
+        """ Apply what changed in the files since they were last read;
+        the class lock must be held for writing
+        The changes of this process not written yet, still queued for
+        the write-behind thread or being written by it, are applied
+        again on top, as the files do not hold them.
+        """
+        s_class = cls.__name__
+        journal = _file_signature(".db_{}.journal".format(s_class))
+        size = journal[2] if journal else 0
+        offset = JOURNAL_OFFSETS.get(s_class, 0)
+        snapshot = _file_signature(".db_{}.json".format(s_class))
+        if snapshot != SNAPSHOTS.get(s_class, _MISSING) or size < offset:
+            cls._merge_snapshot()
+        elif size > offset:
+            JOURNAL_SIZES[s_class] = \
+                JOURNAL_SIZES.get(s_class, 0) + cls.replay_journal(offset)
+        else:
+            return
+        with _pending_lock:
+            unwritten = FLUSHING.get(s_class, []) + \
+                PENDING.get(s_class, (cls, []))[1]
+        for entry in unwritten:
+            cls._apply(entry)
+        cls._changed()
+
+    @classmethod
+    def _merge_snapshot(cls):
+        """ Reload the snapshot, keeping the objects whose record did not
+        change, then replay the whole journal; the class lock must be
+        held for writing
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        SNAPSHOTS[s_class] = _file_signature(file_path)
+        records = {}
+        if path.exists(file_path):
+            with open(file_path, 'r') as f:
+                records = json.load(f)
+
+        objs = DATA.get(s_class)
+        if isinstance(objs, LazyObjects):
+            DATA[s_class] = LazyObjects(cls, records)
+            INDEXES.pop(s_class, None)
+            INDEXED_VALUES.pop(s_class, None)
+        else:
+            objs = DATA.setdefault(s_class, {})
+            for obj_id in [obj_id for obj_id in objs
+                           if obj_id not in records]:
+                objs.pop(obj_id)._unindex()
+            changed = [(obj_id, record)
+                       for obj_id, record in records.items()
+                       if obj_id not in objs or
+                       objs[obj_id].to_json(True) != record]
+            rebuilt = cls.from_records(record for _, record in changed)
+            for (obj_id, _), obj in zip(changed, rebuilt):
+                objs[obj_id] = obj
+                obj._index()
+        JOURNAL_SIZES[s_class] = cls.replay_journal()
+
+    @classmethod
+    @contextmanager
+    def _files_locked(cls):
+        """ With DB_SHARED=1, keep other processes from writing the files
+        of this class, and catch up with what they wrote first; the class
+        lock must be held for writing
+        """
+        if not SHARED:
+            yield
+            return
+        s_class = cls.__name__
+        with _file_lock:
+            held = _flocks.get(s_class)
+            if held is None:
+                fd = os.open(".db_{}.lock".format(s_class),
+                             os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except BaseException:
+                    os.close(fd)
+                    raise
+                held = _flocks[s_class] = [fd, 0]
+            held[1] += 1
+            try:
+                if held[1] == 1:
+                    cls._catch_up()
+                yield
+            finally:
+                held[1] -= 1
+                if held[1] == 0:
+                    del _flocks[s_class]
+                    os.close(held[0])
+
+    @classmethod
+    @contextmanager
+    def _writing_files(cls):
+        """ Hold the locks needed to write the files of this class
+        Readers go on meanwhile, unless DB_SHARED=1 where catching up
+        with other processes may change the objects
+        """
+        rw_lock = cls.lock()
+        with (rw_lock.writing() if SHARED else rw_lock.reading()):
+            with _file_lock, cls._files_locked():
+                yield
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
+        The snapshot is written to a temporary file and renamed over the
+        previous one; the journal it supersedes is then discarded.
+        Readers go on while the snapshot is taken and written; changes
+        wait for it.
         """
+        if cls.storage() is not None:
+            return
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with cls._writing_files():
+            objs_json = {}
+            if isinstance(DATA[s_class], LazyObjects):
+                objs_json.update(DATA[s_class].serialized_items())
+            else:
+                for obj_id, obj in DATA[s_class].items():
+                    objs_json[obj_id] = obj.to_json(True)
+
+            tmp_path = "{}.tmp".format(file_path)
+            with open(tmp_path, 'w') as f:
+                # dumps encodes in C, dump would not
+                f.write(json.dumps(objs_json))
+                if FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+            if FSYNC:
+                _fsync_directory(path.dirname(file_path))
+
+            journal_path = ".db_{}.journal".format(s_class)
+            if path.exists(journal_path):
+                os.remove(journal_path)
+            JOURNAL_SIZES[s_class] = 0
+            JOURNAL_OFFSETS[s_class] = 0
+            SNAPSHOTS[s_class] = _file_signature(file_path)
+
+    @classmethod
+    def append_to_journal(cls, entries: List[dict]):
+        """ Append entries to the journal with a single write
+        Compact the journal into a snapshot once it outgrows both
+        JOURNAL_COMPACT_THRESHOLD and the number of objects
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+        data = lines.encode()
+        with cls._writing_files():
+            cls._truncate_journal()
+            fd = os.open(journal_path,
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    written = os.write(fd, view)
+                    if written == 0:
+                        raise OSError("short write to {}".format(
+                            journal_path))
+                    view = view[written:]
+                if FSYNC:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            JOURNAL_OFFSETS[s_class] = \
+                JOURNAL_OFFSETS.get(s_class, 0) + len(data)
+            JOURNAL_SIZES[s_class] = \
+                JOURNAL_SIZES.get(s_class, 0) + len(entries)
+            if JOURNAL_SIZES[s_class] > max(JOURNAL_COMPACT_THRESHOLD,
+                                            len(DATA[s_class])):
+                cls.save_to_file()
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def write_changes(cls, entries: List[dict]):
+        """ Persist journal entries: applied by the storage backend in one
+        transaction, appended with DB_JOURNAL=1, otherwise folded into a
+        full snapshot
+        """
+        if STORAGE is not None:
+            STORAGE.write(cls, entries)
+        elif JOURNAL_ENABLED:
+            cls.append_to_journal(entries)
+        else:
+            cls.save_to_file()
+
+    @classmethod
+    def persist(cls, entry: dict):
+        """ Persist one change now, or queue it for the write-behind
+        thread when DB_WRITE_BEHIND_INTERVAL is set
+        Inside batch() the change waits for the end of the batch
+        """
+        batch = getattr(_batch, 'entries', None)
+        if batch is not None:
+            batch.setdefault(cls.__name__, (cls, []))[1].append(entry)
+            return
+        cls.persist_all([entry])
+
+    @classmethod
+    def persist_all(cls, entries: List[dict]):
+        """ Persist changes together: one write now, or queued for the
+        write-behind thread when DB_WRITE_BEHIND_INTERVAL is set
+        """
+        if not entries:
+            return
+        if WRITE_BEHIND_INTERVAL <= 0:
+            cls.write_changes(entries)
+            return
+        with _pending_lock:
+            PENDING.setdefault(cls.__name__, (cls, []))[1].extend(entries)
+            count = sum(len(entries) for _, entries in PENDING.values())
+        _start_flusher()
+        if count >= WRITE_BEHIND_MAX_PENDING:
+            _flush_requested.set()
+
+    @classmethod
+    @contextmanager
+    def batch(cls):
+        """ Apply the saves and removals of a with block, then persist
+        them with a single write: one snapshot, journal append or
+        storage transaction
+        The objects of the class stay locked for the whole block, so
+        readers see all of the changes or none of them. Changes made
+        before an exception are persisted too. With a storage backend,
+        get() within the block sees the objects saved or removed in it.
+        """
+        if getattr(_batch, 'entries', None) is not None:
+            yield
+            return
+        with cls.lock().writing(), cls._files_locked():
+            _batch.entries = {}
+            _batch.objects = {}
+            try:
+                yield
+            finally:
+                batch, _batch.entries = _batch.entries, None
+                _batch.objects = None
+                for other, entries in batch.values():
+                    other.persist_all(entries)
+
+    @classmethod
+    def _batched(cls) -> dict:
+        """ Objects of this class saved, or None for removed, in the
+        current batch, by id; None outside of a batch
+        """
+        objects = getattr(_batch, 'objects', None)
+        if objects is None:
+            return None
+        return objects.setdefault(cls.__name__, {})
+
+    @classmethod
+    def rebuild_indexes(cls):
+        """ Rebuild the indexes of `indexed_attributes` from all objects
+        """
+        s_class = cls.__name__
+        with cls.lock().writing():
+            INDEXES[s_class] = {attr: {}
+                                for attr in cls.indexed_attributes}
+            INDEXED_VALUES[s_class] = {}
+            for obj in DATA.get(s_class, {}).values():
+                obj._index()
+
+    def _index(self):
+        """ Point the indexes at the current values of this object
+        """
+        cls = self.__class__
+        if not cls.indexed_attributes:
+            return
+        s_class = cls.__name__
+        if s_class not in INDEXES:
+            # not built yet: the first search builds it from DATA
+            return
+        values = tuple(getattr(self, attr, None)
+                       for attr in cls.indexed_attributes)
+        if INDEXED_VALUES[s_class].get(self.id) == values:
+            return
+        self._unindex()
+        for attr, value in zip(cls.indexed_attributes, values):
+            try:
+                INDEXES[s_class][attr].setdefault(value, {})[self.id] = None
+            except TypeError:
+                # unhashable values are only found by a full scan
+                pass
+        INDEXED_VALUES[s_class][self.id] = values
+
+    def _unindex(self):
+        """ Remove this object from the indexes
+        """
+        s_class = self.__class__.__name__
+        values = INDEXED_VALUES.get(s_class, {}).pop(self.id, None)
+        if values is None:
+            return
+        for attr, value in zip(self.__class__.indexed_attributes, values):
+            try:
+                bucket = INDEXES[s_class][attr].get(value)
+            except TypeError:
+                continue
+            if bucket is not None:
+                bucket.pop(self.id, None)
+                if not bucket:
+                    del INDEXES[s_class][attr][value]
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        cls = self.__class__
+        s_class = cls.__name__
+        if STORAGE is not None:
+            self.updated_at = datetime.utcnow()
+            batched = cls._batched()
+            if batched is not None:
+                batched[self.id] = self
+            cls.persist({'op': 'put', 'obj': self.to_json(True)})
+            return
+        # changes are persisted under the locks so that the files
+        # record them in the order they were applied
+        with cls.lock().writing(), cls._files_locked():
+            self.updated_at = datetime.utcnow()
+            DATA[s_class][self.id] = self
+            self._index()
+            cls._changed()
+            cls.persist({'op': 'put', 'obj': self.to_json(True)})
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        cls = self.__class__
+        s_class = cls.__name__
+        if STORAGE is not None:
+            batched = cls._batched()
+            if batched is not None:
+                batched[self.id] = None
+            cls.persist({'op': 'del', 'id': self.id})
+            return
+        with cls.lock().writing(), cls._files_locked():
+            if DATA[s_class].get(self.id) is not None:
+                del DATA[s_class][self.id]
+                self._unindex()
+                cls._changed()
+                cls.persist({'op': 'del', 'id': self.id})
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
         s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        storage = cls.storage()
+        if storage is not None:
+            return storage.count(cls)
+        with cls.lock().reading():
+            return len(DATA[s_class].keys())
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,16 +1060,61 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def iter_all(cls) -> Iterator[TypeVar('Base')]:
+        """ Iterate over all objects, fetching each one when reached
+        Objects removed while iterating are skipped
+        """
+        s_class = cls.__name__
+        storage = cls.storage()
+        if storage is not None:
+            yield from storage.iter_all(cls)
+            return
+        with cls.lock().reading():
+            obj_ids = list(DATA[s_class])
+        for obj_id in obj_ids:
+            obj = cls.get(obj_id)
+            if obj is not None:
+                yield obj
+
+    @classmethod
+    def page(cls, limit: int, after: str = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects in ID order, starting after the
+        ID `after`
+        """
+        s_class = cls.__name__
+        storage = cls.storage()
+        if storage is not None:
+            return storage.page(cls, limit, after)
+        with cls.lock().reading():
+            objs = DATA[s_class]
+            if after is None:
+                ids = heapq.nsmallest(limit, objs)
+            else:
+                ids = heapq.nsmallest(limit, (obj_id for obj_id in objs
+                                              if obj_id > after))
+            return [objs[obj_id] for obj_id in ids]
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
         s_class = cls.__name__
-        return DATA[s_class].get(id)
+        storage = cls.storage()
+        if storage is not None:
+            batched = cls._batched()
+            if batched is not None and id in batched:
+                return batched[id]
+            return storage.get(cls, id)
+        with cls.lock().reading():
+            return DATA[s_class].get(id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+        An index on one of the attributes narrows the candidates,
+        otherwise all objects are scanned. Indexes follow the saved
+        state of the objects.
         """
         s_class = cls.__name__
         def _search(obj):
@@ -133,5 +1124,26 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        storage = cls.storage()
+        if storage is not None:
+            return list(filter(_search, storage.search(cls, attributes)))
+        if cls.indexed_attributes and s_class not in INDEXES:
+            with cls.lock().writing():
+                if s_class not in INDEXES:
+                    cls.rebuild_indexes()
+        with cls.lock().reading():
+            objs = DATA[s_class]
+            indexes = INDEXES.get(s_class, {})
+            for k, v in attributes.items():
+                if k not in indexes:
+                    continue
+                try:
+                    ids = indexes[k].get(v, ())
+                except TypeError:
+                    continue
+                candidates = [objs[obj_id] for obj_id in ids
+                              if obj_id in objs]
+                return list(filter(_search, candidates))
+
+            return list(filter(_search, objs.values()))
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+""" Storage backends of the models
+The JSON files are handled by models.base itself; the backends here
+replace them when DB_STORAGE names one of STORAGES.
+"""
+from abc import ABC, abstractmethod
+from typing import TypeVar, List, Iterator
+from os import path
+import json
+import os
+import sqlite3
+import threading
+
+
+class Storage(ABC):
+    """ Interface of a storage backend
+    Objects go in as journal entries - {'op': 'put', 'obj': {...}} or
+    {'op': 'del', 'id': ...} - and come out as instances of `cls`.
+    """
+
+    def __init__(self, location: str, fsync: bool = False):
+        """ Initialize a Storage on `location`
+        """
+        self.location = location
+        self.fsync = fsync
+
+    @abstractmethod
+    def load(self, cls: type):
+        """ Prepare the storage of `cls`
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def write(self, cls: type, entries: List[dict]):
+        """ Apply journal entries atomically
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Return one object by ID, None if missing
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def generation(self, cls: type) -> int:
+        """ Number that changes whenever objects of `cls` are written
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self, cls: type) -> int:
+        """ Count all objects
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, cls: type,
+               attributes: dict) -> List[TypeVar('Base')]:
+        """ Return at least the objects with matching attributes
+        The caller filters the result again.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def page(self, cls: type, limit: int,
+             after: str = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects in ID order after the ID `after`
+        """
+        raise NotImplementedError
+
+    def iter_all(self, cls: type,
+                 chunk_size: int = 1000) -> Iterator[TypeVar('Base')]:
+        """ Iterate over all objects in ID order, `chunk_size` at a time
+        """
+        after = None
+        while True:
+            objs = self.page(cls, chunk_size, after)
+            yield from objs
+            if len(objs) < chunk_size:
+                return
+            after = objs[-1].id
+
+
+class SQLiteStorage(Storage):
+    """ Objects stored as JSON documents in a SQLite database
+    One table per class, keyed by id, with an expression index on each
+    of its `indexed_attributes`; the _generations table counts the
+    writes of each class, starting from a random number. Each thread
+    has its own connection, whose statement cache keeps the queries
+    prepared; the database runs in WAL mode so readers, in any process,
+    do not block the writer.
+    """
+
+    def __init__(self, location: str, fsync: bool = False):
+        """ Initialize a SQLiteStorage on the database file `location`
+        """
+        super().__init__(path.abspath(location), fsync)
+        self._local = threading.local()
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Return the connection of the calling thread
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.location, timeout=30,
+                                         cached_statements=256)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous={}".format(
+                "FULL" if self.fsync else "NORMAL"))
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _table(self, cls: type) -> str:
+        """ Return the quoted table of `cls`, creating it if needed
+        """
+        s_class = cls.__name__
+        table = self._tables.get(s_class)
+        if table is not None:
+            return table
+        table = '"{}"'.format(s_class.replace('"', '""'))
+        with self._lock, self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} (id TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL) WITHOUT ROWID".format(table))
+            for attr in cls.indexed_attributes:
+                connection.execute(
+                    'CREATE INDEX IF NOT EXISTS "{}_{}" ON {} ({})'.format(
+                        s_class, attr, table, self._field(attr)))
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS _generations (name TEXT"
+                " PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID")
+            connection.execute(
+                "INSERT OR IGNORE INTO _generations (name, value)"
+                " VALUES (?, abs(random() % 1000000000000))", (s_class,))
+            self._tables[s_class] = table
+        return table
+
+    @staticmethod
+    def _field(attr: str) -> str:
+        """ SQL expression of an attribute; indexes only serve queries
+        spelling it the same way
+        """
+        return "json_extract(data, '$.{}')".format(attr)
+
+    def _objects(self, cls: type, rows) -> List[TypeVar('Base')]:
+        """ Build the objects of `cls` from (data,) rows
+        """
+        return cls.from_records(json.loads(data) for (data,) in rows)
+
+    def load(self, cls: type):
+        """ Create the table and indexes of `cls`
+        """
+        self._table(cls)
+
+    def write(self, cls: type, entries: List[dict]):
+        """ Apply journal entries in one transaction
+        """
+        table = self._table(cls)
+        put = "INSERT OR REPLACE INTO {} (id, data) VALUES (?, ?)".format(
+            table)
+        delete = "DELETE FROM {} WHERE id = ?".format(table)
+        with self._connection() as connection:
+            connection.execute("UPDATE _generations SET value = value + 1"
+                               " WHERE name = ?", (cls.__name__,))
+            for entry in entries:
+                if entry.get('op') == 'put':
+                    obj = entry.get('obj')
+                    connection.execute(put, (obj.get('id'),
+                                             json.dumps(obj)))
+                elif entry.get('op') == 'del':
+                    connection.execute(delete, (entry.get('id'),))
+
+    def get(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Return one object by ID, None if missing
+        """
+        rows = self._connection().execute(
+            "SELECT data FROM {} WHERE id = ?".format(self._table(cls)),
+            (obj_id,)).fetchall()
+        objs = self._objects(cls, rows)
+        return objs[0] if objs else None
+
+    def generation(self, cls: type) -> int:
+        """ Number of writes of `cls`, from a random start
+        """
+        self._table(cls)
+        return self._connection().execute(
+            "SELECT value FROM _generations WHERE name = ?",
+            (cls.__name__,)).fetchone()[0]
+
+    def count(self, cls: type) -> int:
+        """ Count all objects
+        """
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM {}".format(self._table(cls))).fetchone()[0]
+
+    def search(self, cls: type,
+               attributes: dict) -> List[TypeVar('Base')]:
+        """ Return at least the objects with matching attributes
+        Stored attributes compared to plain values are matched in SQL,
+        through an index when there is one; anything else is left to
+        the caller.
+        """
+        clauses = []
+        params = []
+        for key, value in attributes.items():
+            if key not in cls.serialized_attributes or \
+                    key in ('created_at', 'updated_at'):
+                continue
+            if value is None:
+                clauses.append("{} IS NULL".format(self._field(key)))
+            elif type(value) in (str, int, float):
+                clauses.append("{} = ?".format(self._field(key)))
+                params.append(value)
+        query = "SELECT data FROM {}".format(self._table(cls))
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        rows = self._connection().execute(query, params).fetchall()
+        return self._objects(cls, rows)
+
+    def page(self, cls: type, limit: int,
+             after: str = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects in ID order after the ID `after`
+        """
+        table = self._table(cls)
+        connection = self._connection()
+        if after is None:
+            rows = connection.execute(
+                "SELECT data FROM {} ORDER BY id LIMIT ?".format(table),
+                (limit,)).fetchall()
+        else:
+            rows = connection.execute(
+                "SELECT data FROM {} WHERE id > ? ORDER BY id LIMIT ?"
+                .format(table), (after, limit)).fetchall()
+        return self._objects(cls, rows)
+
+
+STORAGES = {
+    'sqlite': SQLiteStorage,
+}
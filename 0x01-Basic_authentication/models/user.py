@@ -2,21 +2,34 @@
 """ User module
 """
 import hashlib
+import sys
 from models.base import Base
 
 
+def _intern(value):
+    """ Share one copy of repeated strings such as names
+    """
+    return sys.intern(value) if type(value) is str else value
+
+
 class User(Base):
     """ User class
     """
 
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+    serialized_attributes = Base.serialized_attributes + __slots__
+    indexed_attributes = ('email',)
+    interned_attributes = ('first_name', 'last_name')
+    hydrate_slots = True
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
         super().__init__(*args, **kwargs)
         self.email = kwargs.get('email')
         self._password = kwargs.get('_password')
-        self.first_name = kwargs.get('first_name')
-        self.last_name = kwargs.get('last_name')
+        self.first_name = _intern(kwargs.get('first_name'))
+        self.last_name = _intern(kwargs.get('last_name'))
 
     @property
     def password(self) -> str:
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+""" Stress and recovery tests of the models storage
+
+Usage: ./stress_test.py [-v]
+       python3 -m pytest stress_test.py
+
+Every case runs on the JSON files of a temporary directory and fails
+loudly, whatever the optimization level, when a write is lost.
+"""
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from models import base
+from models.base import DATA, FLUSHING, PENDING, Base
+from models.user import User
+
+
+class Note(Base):
+    """ Second model, to flush more than one class at a time
+    """
+
+    __slots__ = ('text',)
+    serialized_attributes = Base.serialized_attributes + __slots__
+    hydrate_slots = True
+
+    def __init__(self, *args: list, **kwargs: dict):
+        """ Initialize a Note instance
+        """
+        super().__init__(*args, **kwargs)
+        self.text = kwargs.get('text')
+
+
+class StorageTestCase(unittest.TestCase):
+    """ Run each test in its own directory with a fresh store
+    """
+
+    def setUp(self):
+        """ Move to an empty directory and load empty models
+        """
+        self.saved = (base.STORAGE, base.JOURNAL_ENABLED,
+                      base.WRITE_BEHIND_INTERVAL)
+        base.STORAGE = None
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        PENDING.clear()
+        FLUSHING.clear()
+        User.load_from_file()
+        Note.load_from_file()
+
+    def tearDown(self):
+        """ Drop what the test left behind and restore the settings
+        """
+        PENDING.clear()
+        FLUSHING.clear()
+        DATA.pop('User', None)
+        DATA.pop('Note', None)
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+        (base.STORAGE, base.JOURNAL_ENABLED,
+         base.WRITE_BEHIND_INTERVAL) = self.saved
+
+    def stored(self, cls: type) -> dict:
+        """ Map of id to the first name or text of the objects of `cls`
+        loaded from the files
+        """
+        cls.load_from_file()
+        attr = 'first_name' if cls is User else 'text'
+        return {obj.id: getattr(obj, attr) for obj in cls.all()}
+
+
+class TestConcurrency(StorageTestCase):
+    """ Writers and readers sharing the store
+    """
+
+    def stress(self, threads: int = 4, per_thread: int = 100):
+        """ Save, update and remove users from `threads` writers while as
+        many readers search, list and snapshot them
+        """
+        errors = []
+        expected = {}
+        done = threading.Event()
+
+        def writer(number: int):
+            try:
+                for i in range(per_thread):
+                    user = User(email="w{}-{}@example.com".format(number, i))
+                    user.save()
+                    if i % 3 == 0:
+                        user.first_name = "Updated"
+                        user.save()
+                    if i % 5 == 0:
+                        user.remove()
+                    else:
+                        expected[user.id] = user.first_name
+            except Exception as e:
+                errors.append(e)
+
+        def reader(number: int):
+            try:
+                while not done.is_set():
+                    User.search({'email': "w{}-0@example.com".format(number)})
+                    User.all()
+                    User.count()
+                    for _ in User.iter_all():
+                        pass
+                    if number == 0:
+                        User.save_to_file()
+            except Exception as e:
+                errors.append(e)
+
+        writers = [threading.Thread(target=writer, args=(n,))
+                   for n in range(threads)]
+        readers = [threading.Thread(target=reader, args=(n,))
+                   for n in range(threads)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual({user.id: user.first_name for user in User.all()},
+                         expected, "lost writes in memory")
+        self.assertEqual(self.stored(User), expected, "lost writes on disk")
+
+    def test_snapshots(self):
+        """ Every change rewrites the snapshot
+        """
+        base.JOURNAL_ENABLED = False
+        self.stress()
+
+    def test_journal(self):
+        """ Every change is appended to the journal
+        """
+        base.JOURNAL_ENABLED = True
+        self.stress()
+
+
+class TestRecovery(StorageTestCase):
+    """ Writes accepted around failures survive a restart
+    """
+
+    def test_torn_journal_tail(self):
+        """ Saves after a crash mid-append are replayed on the next load
+        """
+        base.JOURNAL_ENABLED = True
+        users = [User(email="a{}@example.com".format(i)) for i in range(3)]
+        for user in users:
+            user.save()
+        with open(".db_User.journal", "a") as f:
+            f.write('{"op": "put", "obj": {"id"')
+
+        User.load_from_file()
+        more = [User(email="b{}@example.com".format(i)) for i in range(3)]
+        for user in more:
+            user.save()
+        self.assertEqual(set(self.stored(User)),
+                         {user.id for user in users + more})
+
+    def test_failed_flush_with_two_classes(self):
+        """ A failed write-behind flush keeps the changes of every class
+        queued, in order, and leaves nothing behind once they are written
+        """
+        base.JOURNAL_ENABLED = True
+        base.WRITE_BEHIND_INTERVAL = 3600
+        user = User(email="a@example.com", first_name="Before")
+        user.save()
+        note = Note(text="first")
+        note.save()
+        user.first_name = "After"
+        user.save()
+
+        with mock.patch.object(User, 'write_changes',
+                               side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                base.flush()
+        self.assertEqual(FLUSHING, {})
+        self.assertEqual(sorted(PENDING), ['Note', 'User'])
+        self.assertEqual(len(PENDING['User'][1]), 2)
+
+        base.flush()
+        self.assertEqual(FLUSHING, {})
+        self.assertEqual(PENDING, {})
+        self.assertEqual(self.stored(User), {user.id: "After"})
+        self.assertEqual(self.stored(Note), {note.id: "first"})
+
+
+if __name__ == "__main__":
+    unittest.main()